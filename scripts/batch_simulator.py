@@ -0,0 +1,140 @@
+import numpy as np
+
+from board import build_win_masks
+
+
+PLAYER1 = 'PLAYER 1'
+PLAYER2 = 'PLAYER 2'
+TIE = 'Tie'
+
+# Games simulated together, bounding the memory of the (games, cells) arrays
+_CHUNK_SIZE = 65536
+
+_LINE_MATRICES = {}
+
+
+def line_matrix(board_size, win_length=None):
+    """
+    Build (and cache) the (lines, cells) incidence matrix of the winning lines Game_AI looks at
+    """
+    key = (board_size, board_size if win_length is None else win_length)
+    if key not in _LINE_MATRICES:
+        cells = board_size * board_size
+        lines = build_win_masks(*key)
+        _LINE_MATRICES[key] = np.array([[(line >> cell) & 1 for cell in range(cells)] for line in lines], dtype=np.int32)
+    return _LINE_MATRICES[key]
+
+
+def line_candidates(own, other, empty, lines, win_length):
+    """
+    Vectorized Game_AI line choice: per game, the empty cells of the lines free of other holding the most own cells
+    :return: a (games, cells) array of candidate multiplicities, all zero where a game has no candidate line
+    """
+    own_counts = own @ lines.T
+    other_counts = other @ lines.T
+    open_lines = (other_counts == 0) & (own_counts < win_length)
+    line_scores = np.where(open_lines, own_counts, -1)
+    best_scores = line_scores.max(axis=1, keepdims=True)
+    chosen_lines = (open_lines & (line_scores == best_scores)).astype(np.int32)
+    return (chosen_lines @ lines) * empty
+
+
+def weighted_draw(weights, rng):
+    """
+    Draw one cell per game with probability proportional to its weight
+    """
+    cumulative = np.cumsum(weights, axis=1)
+    targets = rng.random(len(weights)) * cumulative[:, -1]
+    return (cumulative > targets[:, None]).argmax(axis=1)
+
+
+def choose_cells(own, other, thresholds, board_size, rng, win_length=None):
+    """
+    Vectorized Game_AI move choice, random on an empty board and when the drawn strategy has no candidate
+    :param own: a (games, cells) 0/1 array of the mover's cells
+    :param other: a (games, cells) 0/1 array of the opponent's cells
+    :param thresholds: a (games, 2) array of cumulative (aggressive, aggressive + defensive) strategy probabilities
+    :return: a (games,) array of chosen cells, meaningless where the board is full
+    """
+    win_length = board_size if win_length is None else win_length
+    lines = line_matrix(board_size, win_length)
+    empty = 1 - own - other
+    is_started = empty.sum(axis=1) < empty.shape[1]
+
+    draws = rng.random(len(own))
+    is_aggressive = is_started & (draws < thresholds[:, 0])
+    is_defensive = is_started & ~is_aggressive & (draws < thresholds[:, 1])
+
+    weights = empty.copy()
+    aggressive = line_candidates(own[is_aggressive], other[is_aggressive], empty[is_aggressive], lines, win_length)
+    has_candidates = aggressive.any(axis=1)
+    weights[np.flatnonzero(is_aggressive)[has_candidates]] = aggressive[has_candidates]
+    defensive = line_candidates(other[is_defensive], own[is_defensive], empty[is_defensive], lines, win_length)
+    has_candidates = defensive.any(axis=1)
+    weights[np.flatnonzero(is_defensive)[has_candidates]] = defensive[has_candidates]
+
+    return weighted_draw(weights, rng)
+
+
+def split_boards(boards, board_size=3):
+    """
+    Split an (N, cells) or (N, n, n) array of positions, positive for the mover's cells and negative for the opponent's, into (N, cells) 0/1 int32 arrays of each player's cells
+    """
+    boards = np.asarray(boards).reshape(-1, board_size * board_size)
+    return (boards > 0).astype(np.int32), (boards < 0).astype(np.int32)
+
+
+def cells_to_masks(cells):
+    """
+    Bit masks of the rows of an (N, cells) 0/1 array
+    """
+    return cells.astype(np.int64) @ (np.int64(1) << np.arange(cells.shape[1], dtype=np.int64))
+
+
+def _play_chunk(genes_1, genes_2, starting_players, board_size, rng, win_length):
+    """
+    Play one chunk of games to the end
+    :param starting_players: a (games,) array, 0 where PLAYER1 starts and 1 where PLAYER2 starts
+    :return: a (games,) array of 0 for PLAYER1 wins, 1 for PLAYER2 wins and 2 for ties
+    """
+    games = len(starting_players)
+    cells = board_size * board_size
+    lines = line_matrix(board_size, win_length)
+    # Cumulative strategy probabilities (aggressive, aggressive + defensive) per player
+    thresholds = np.array([[genes_1[0], genes_1[0] + genes_1[1]], [genes_2[0], genes_2[0] + genes_2[1]]], dtype=np.float64) / 100.0
+
+    filled = np.zeros((2, games, cells), dtype=np.int32)
+    turn = starting_players.astype(np.int64)
+    results = np.full(games, -1, dtype=np.int64)
+    active = np.arange(games)
+
+    for move in range(cells):
+        mover = turn[active]
+        chosen = choose_cells(filled[mover, active], filled[1 - mover, active], thresholds[mover], board_size, rng, win_length)
+        filled[mover, active, chosen] = 1
+
+        has_won = ((filled[mover, active] @ lines.T) == win_length).any(axis=1)
+        results[active[has_won]] = mover[has_won]
+        if move == cells - 1:
+            results[active[~has_won]] = 2
+        active = active[~has_won]
+        turn[active] = 1 - turn[active]
+        if len(active) == 0:
+            break
+
+    return results
+
+
+def play_games(genes_1, genes_2, num_games, board_size=3, rng=None, win_length=None):
+    """
+    Play num_games Game_AI games between the two genes at once, alternating the starting player from PLAYER1
+    :return: a dict of PLAYER1, PLAYER2 and TIE tallies, as the trainer counts them
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    win_length = board_size if win_length is None else win_length
+    tallies = np.zeros(3, dtype=np.int64)
+    for offset in range(0, num_games, _CHUNK_SIZE):
+        starting_players = (np.arange(offset, min(offset + _CHUNK_SIZE, num_games)) % 2)
+        tallies += np.bincount(_play_chunk(genes_1, genes_2, starting_players, board_size, rng, win_length), minlength=3)
+
+    return {PLAYER1: int(tallies[0]), PLAYER2: int(tallies[1]), TIE: int(tallies[2])}
@@ -0,0 +1,372 @@
+PLAYER_1 = 0
+PLAYER_2 = 1
+
+_WIN_MASKS_CACHE = {}
+_WIN_TABLE_CACHE = {}
+_LAYOUT_CACHE = {}
+_SYMMETRY_CACHE = {}
+
+
+def popcount(mask):
+    """
+    Count the filled cells of a bit mask
+    """
+    return bin(mask).count('1')
+
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count  # noqa: F811
+
+
+def build_win_masks(board_size=3, win_length=None):
+    """
+    Build (and cache) the bit masks of every winning line for the given board configuration
+    """
+    board_size = int(board_size)
+    win_length = board_size if win_length is None else int(win_length)
+    key = (board_size, win_length)
+    if key not in _WIN_MASKS_CACHE:
+        masks = []
+        directions = ((0, 1), (1, 0), (1, 1), (1, -1))
+        for row in range(board_size):
+            for col in range(board_size):
+                for d_row, d_col in directions:
+                    end_row = row + d_row * (win_length - 1)
+                    end_col = col + d_col * (win_length - 1)
+                    if not (0 <= end_row < board_size and 0 <= end_col < board_size):
+                        continue
+                    mask = 0
+                    for step in range(win_length):
+                        mask |= 1 << ((row + d_row * step) * board_size + col + d_col * step)
+                    masks.append(mask)
+        _WIN_MASKS_CACHE[key] = tuple(masks)
+    return _WIN_MASKS_CACHE[key]
+
+
+def _build_win_table(board_size, win_length):
+    """
+    Build (and cache) a lookup table flagging every winning mask, for boards small enough to enumerate
+    """
+    key = (board_size, win_length)
+    if key not in _WIN_TABLE_CACHE:
+        win_masks = build_win_masks(board_size, win_length)
+        table = bytearray(1 << (board_size * board_size))
+        for mask in range(len(table)):
+            for win_mask in win_masks:
+                if mask & win_mask == win_mask:
+                    table[mask] = 1
+                    break
+        _WIN_TABLE_CACHE[key] = table
+    return _WIN_TABLE_CACHE[key]
+
+
+def _board_layout(board_size, win_length):
+    """
+    Build (and cache) the win masks, the win masks through each cell and the win table of a board configuration
+    """
+    key = (board_size, win_length)
+    if key not in _LAYOUT_CACHE:
+        cells = board_size * board_size
+        win_masks = build_win_masks(board_size, win_length)
+        win_masks_by_cell = tuple(tuple(mask for mask in win_masks if mask >> cell & 1) for cell in range(cells))
+        win_table = _build_win_table(board_size, win_length) if cells <= 16 else None
+        _LAYOUT_CACHE[key] = (win_masks, win_masks_by_cell, win_table)
+    return _LAYOUT_CACHE[key]
+
+
+def lists_to_mask(filled):
+    """
+    Convert a nested list of 0/1 cells into a bit mask
+    """
+    mask = 0
+    bit = 1
+    for row in filled:
+        for cell in row:
+            if cell:
+                mask |= bit
+            bit <<= 1
+    return mask
+
+
+def mask_to_lists(mask, board_size=3):
+    """
+    Convert a bit mask into a nested list of 0/1 cells
+    """
+    return [[(mask >> (i * board_size + j)) & 1 for j in range(board_size)] for i in range(board_size)]
+
+
+def mask_cells(mask):
+    """
+    List of the set cell indices of a mask in ascending order
+    """
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+def symmetry_permutations(board_size=3):
+    """
+    Cell permutations of the 8 board symmetries (rotations and reflections), identity first
+    """
+    n = int(board_size)
+    transforms = (
+        lambda r, c: (r, c),
+        lambda r, c: (c, n - 1 - r),
+        lambda r, c: (n - 1 - r, n - 1 - c),
+        lambda r, c: (n - 1 - c, r),
+        lambda r, c: (r, n - 1 - c),
+        lambda r, c: (n - 1 - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (n - 1 - c, n - 1 - r),
+    )
+    permutations = []
+    for transform in transforms:
+        permutation = []
+        for cell in range(n * n):
+            row, col = transform(cell // n, cell % n)
+            permutation.append(row * n + col)
+        permutations.append(tuple(permutation))
+    return tuple(permutations)
+
+
+def _symmetry_tables(board_size):
+    """
+    Build (and cache) per-byte lookup tables mapping mask chunks through each symmetry, with the inverse cell permutations
+    """
+    if board_size not in _SYMMETRY_CACHE:
+        cells = board_size * board_size
+        permutations = symmetry_permutations(board_size)
+        chunk_tables = []
+        for permutation in permutations:
+            tables = []
+            for offset in range(0, cells, 8):
+                table = []
+                for byte in range(256):
+                    mask = 0
+                    for bit in range(8):
+                        if byte >> bit & 1 and offset + bit < cells:
+                            mask |= 1 << permutation[offset + bit]
+                    table.append(mask)
+                tables.append(tuple(table))
+            chunk_tables.append(tuple(tables))
+        inverses = []
+        for permutation in permutations:
+            inverse = [0] * cells
+            for cell, image in enumerate(permutation):
+                inverse[image] = cell
+            inverses.append(tuple(inverse))
+        _SYMMETRY_CACHE[board_size] = (permutations, tuple(chunk_tables), tuple(inverses))
+    return _SYMMETRY_CACHE[board_size]
+
+
+def transform_mask(mask, symmetry, board_size=3):
+    """
+    Map a mask through one of the symmetry_permutations
+    """
+    tables = _symmetry_tables(board_size)[1][symmetry]
+    result = 0
+    for table in tables:
+        result |= table[mask & 0xFF]
+        mask >>= 8
+    return result
+
+
+def canonical_position(mover_mask, other_mask, board_size=3):
+    """
+    Symmetry-reduced key of a position and the symmetry index mapping the position onto it
+    """
+    cells = board_size * board_size
+    best_key = None
+    best_symmetry = 0
+    for symmetry, tables in enumerate(_symmetry_tables(board_size)[1]):
+        mover = 0
+        other = 0
+        mover_rest = mover_mask
+        other_rest = other_mask
+        for table in tables:
+            mover |= table[mover_rest & 0xFF]
+            other |= table[other_rest & 0xFF]
+            mover_rest >>= 8
+            other_rest >>= 8
+        key = (mover << cells) | other
+        if best_key is None or key < best_key:
+            best_key = key
+            best_symmetry = symmetry
+    return best_key, best_symmetry
+
+
+def map_cell(cell, symmetry, board_size=3):
+    """
+    Image of a cell under one of the symmetry_permutations
+    """
+    return _symmetry_tables(board_size)[0][symmetry][cell]
+
+
+def unmap_cell(cell, symmetry, board_size=3):
+    """
+    Pre-image of a cell under one of the symmetry_permutations
+    """
+    return _symmetry_tables(board_size)[2][symmetry][cell]
+
+
+class Board():
+
+    def __init__(self, board_size=3, win_length=None, filled=(0, 0)):
+        """
+        Initialize a board backed by one bit mask per player
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._CELLS = self._BOARD_SIZE * self._BOARD_SIZE
+        self._FULL_MASK = (1 << self._CELLS) - 1
+        self._WIN_MASKS, self._WIN_MASKS_BY_CELL, self._WIN_TABLE = _board_layout(self._BOARD_SIZE, self._WIN_LENGTH)
+
+        self.filled = [int(filled[PLAYER_1]), int(filled[PLAYER_2])]
+
+    @classmethod
+    def from_lists(cls, player_1_filled, player_2_filled, win_length=None):
+        """
+        Build a board from the nested list representation used by the choose_position signatures
+        """
+        return cls(len(player_1_filled), win_length, (lists_to_mask(player_1_filled), lists_to_mask(player_2_filled)))
+
+    @property
+    def board_size(self):
+        return self._BOARD_SIZE
+
+    @property
+    def win_length(self):
+        return self._WIN_LENGTH
+
+    @property
+    def cells(self):
+        return self._CELLS
+
+    @property
+    def full_mask(self):
+        return self._FULL_MASK
+
+    @property
+    def win_masks(self):
+        return self._WIN_MASKS
+
+    @property
+    def win_masks_by_cell(self):
+        return self._WIN_MASKS_BY_CELL
+
+    def copy(self):
+        """
+        Copy the board
+        """
+        return Board(self._BOARD_SIZE, self._WIN_LENGTH, self.filled)
+
+    def clear(self):
+        """
+        Empty the board
+        """
+        self.filled[PLAYER_1] = 0
+        self.filled[PLAYER_2] = 0
+
+    def cell(self, row, col):
+        """
+        Cell index of a (row, col) position
+        """
+        return row * self._BOARD_SIZE + col
+
+    def position(self, cell):
+        """
+        (row, col) position of a cell index
+        """
+        return [cell // self._BOARD_SIZE, cell % self._BOARD_SIZE]
+
+    def occupied(self):
+        """
+        Mask of every filled cell
+        """
+        return self.filled[PLAYER_1] | self.filled[PLAYER_2]
+
+    def empty(self):
+        """
+        Mask of every empty cell
+        """
+        return self._FULL_MASK & ~(self.filled[PLAYER_1] | self.filled[PLAYER_2])
+
+    def is_legal(self, cell):
+        """
+        Check if the given cell is empty
+        """
+        return not (self.filled[PLAYER_1] | self.filled[PLAYER_2]) >> cell & 1
+
+    def move(self, cell, player):
+        """
+        Fill the given cell for the player
+        """
+        self.filled[player] |= 1 << cell
+
+    def undo(self, cell, player):
+        """
+        Clear the given cell for the player
+        """
+        self.filled[player] &= ~(1 << cell)
+
+    def empty_cells(self):
+        """
+        List of empty cell indices in row-major order
+        """
+        return mask_cells(self.empty())
+
+    def is_full(self):
+        """
+        Check if every cell is filled
+        """
+        return self.filled[PLAYER_1] | self.filled[PLAYER_2] == self._FULL_MASK
+
+    def is_winning_mask(self, mask):
+        """
+        Check if the given mask contains a full winning line
+        """
+        if self._WIN_TABLE is not None:
+            return self._WIN_TABLE[mask] == 1
+        for win_mask in self._WIN_MASKS:
+            if mask & win_mask == win_mask:
+                return True
+        return False
+
+    def has_won(self, player):
+        """
+        Check if the player has a full winning line
+        """
+        return self.is_winning_mask(self.filled[player])
+
+    def wins_with(self, cell, player):
+        """
+        Check if the player's move at the given cell completes a winning line
+        """
+        mask = self.filled[player] | (1 << cell)
+        if self._WIN_TABLE is not None:
+            return self._WIN_TABLE[mask] == 1
+        for win_mask in self._WIN_MASKS_BY_CELL[cell]:
+            if mask & win_mask == win_mask:
+                return True
+        return False
+
+    def winner(self):
+        """
+        PLAYER_1 or PLAYER_2 if someone has won, -1 if the board is full, None otherwise
+        """
+        if self.is_winning_mask(self.filled[PLAYER_1]):
+            return PLAYER_1
+        if self.is_winning_mask(self.filled[PLAYER_2]):
+            return PLAYER_2
+        if self.is_full():
+            return -1
+        return None
+
+    def to_lists(self, player):
+        """
+        Nested list representation of the player's cells
+        """
+        return mask_to_lists(self.filled[player], self._BOARD_SIZE)
@@ -0,0 +1,10 @@
+# Headless engine core: the board, the engines and the batch simulator, free of pygame and matplotlib.
+# Workers and command line jobs import from here; the ui (game, run_game) and the trainer plot load those libraries themselves
+from batch_simulator import play_games
+from board import Board, PLAYER_1, PLAYER_2
+from game_ai import Game_AI
+from mcts import Game_MCTS
+from minimax import Game_Minimax
+from random_ai import Game_Random
+
+__all__ = ['Board', 'PLAYER_1', 'PLAYER_2', 'Game_AI', 'Game_MCTS', 'Game_Minimax', 'Game_Random', 'play_games']
@@ -0,0 +1,97 @@
+from board import Board
+from policy_table import AGGRESSIVE, DEFENSIVE, RANDOM, Policy_Table
+
+
+PLAYER1 = 'PLAYER 1'
+PLAYER2 = 'PLAYER 2'
+TIE = 'Tie'
+
+
+class Exact_Evaluator():
+
+    def __init__(self, board_size=3, max_entries=1000000):
+        """
+        Initialize an evaluator of exact Game_AI matchup probabilities, memoized per (genes, position)
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._MAX_ENTRIES = int(max_entries)
+        self._board = Board(self._BOARD_SIZE)
+        self._policy_table = Policy_Table.shared(self._BOARD_SIZE)
+
+        self._outcomes = {}
+        self._policies = {}
+
+    def _policy(self, genes, mover_mask, other_mask):
+        """
+        Probability of each cell Game_AI with the given genes chooses in a position
+        :return: a list of (cell, probability) pairs
+        """
+        key = (genes, mover_mask, other_mask)
+        policy = self._policies.get(key)
+        if policy is None:
+            candidates = self._policy_table.candidates(mover_mask, other_mask)
+            if mover_mask | other_mask == 0:
+                # Empty Board: always a random choice
+                weights = ((RANDOM, 1.0),)
+            else:
+                weights = ((AGGRESSIVE, genes[0] / 100.0), (DEFENSIVE, genes[1] / 100.0), (RANDOM, genes[2] / 100.0))
+            probabilities = {}
+            for strategy, weight in weights:
+                if weight == 0:
+                    continue
+                position_choices = candidates[strategy] if len(candidates[strategy]) > 0 else candidates[RANDOM]
+                for cell in position_choices:
+                    probabilities[cell] = probabilities.get(cell, 0.0) + weight / len(position_choices)
+            policy = list(probabilities.items())
+            self._policies[key] = policy
+        return policy
+
+    def _outcome(self, mover_genes, other_genes, mover_mask, other_mask):
+        """
+        Probabilities that the player to move wins, loses or ties from a position
+        """
+        key = (mover_genes, other_genes, mover_mask, other_mask)
+        outcome = self._outcomes.get(key)
+        if outcome is None:
+            win = 0.0
+            lose = 0.0
+            tie = 0.0
+            for cell, probability in self._policy(mover_genes, mover_mask, other_mask):
+                child_mask = mover_mask | (1 << cell)
+                if self._board.is_winning_mask(child_mask):
+                    win += probability
+                elif child_mask | other_mask == self._board.full_mask:
+                    tie += probability
+                else:
+                    child_win, child_lose, child_tie = self._outcome(other_genes, mover_genes, other_mask, child_mask)
+                    win += probability * child_lose
+                    lose += probability * child_win
+                    tie += probability * child_tie
+            outcome = (win, lose, tie)
+            self._outcomes[key] = outcome
+        return outcome
+
+    def evaluate(self, genes_1, genes_2):
+        """
+        Exact outcome probabilities of a game between the two genes for each starting player
+        :return: a dict mapping the starting player to a dict of PLAYER1, PLAYER2 and TIE probabilities
+        """
+        if len(self._outcomes) + len(self._policies) > self._MAX_ENTRIES:
+            self._outcomes.clear()
+            self._policies.clear()
+        genes_1 = tuple(int(gene) for gene in genes_1)
+        genes_2 = tuple(int(gene) for gene in genes_2)
+
+        player_1_win, player_1_lose, player_1_tie = self._outcome(genes_1, genes_2, 0, 0)
+        player_2_win, player_2_lose, player_2_tie = self._outcome(genes_2, genes_1, 0, 0)
+        return {PLAYER1: {PLAYER1: player_1_win, PLAYER2: player_1_lose, TIE: player_1_tie},
+                PLAYER2: {PLAYER1: player_2_lose, PLAYER2: player_2_win, TIE: player_2_tie}}
+
+    def expected_results(self, genes_1, genes_2, epoch_size):
+        """
+        Expected PLAYER1, PLAYER2 and TIE tallies of an epoch alternating the starting player from PLAYER1
+        """
+        probabilities = self.evaluate(genes_1, genes_2)
+        player_1_starts = (epoch_size + 1) // 2
+        player_2_starts = epoch_size // 2
+        return {result: player_1_starts * probabilities[PLAYER1][result] + player_2_starts * probabilities[PLAYER2][result] for result in (PLAYER1, PLAYER2, TIE)}
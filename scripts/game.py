@@ -1,9 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
 import pygame
 import random
+import threading
+import time
 
+from board import Board, PLAYER_1, PLAYER_2
 from game_ai import Game_AI
+import game_record
+import metrics
+from mcts import Game_MCTS
 from minimax import Game_Minimax
 
+# Fonts shared by every game, SysFont lookups being slow
+_FONTS = {}
+
+
+def _get_font(font, font_size):
+    """
+    Cached pygame font of the given name and size
+    """
+    key = (font, font_size)
+    if key not in _FONTS:
+        _FONTS[key] = pygame.font.SysFont(font, font_size)
+    return _FONTS[key]
+
 
 class Game():
 
@@ -12,9 +33,10 @@ class Game():
     PLAYER1 = 'PLAYER 1'
     PLAYER2 = 'PLAYER 2'
 
-    def __init__(self, board_width, board_height, should_use_ai, ai_genes, should_use_minimax, background=(245,245,245), line_color=(220, 220, 220), line_thickness=8, shape_thickness=10, player_o_color=(255, 69, 0),player_x_color=(41, 41, 41)):
+    def __init__(self, board_width, board_height, should_use_ai, ai_genes, should_use_minimax, background=(245,245,245), line_color=(220, 220, 220), line_thickness=8, shape_thickness=10, player_o_color=(255, 69, 0),player_x_color=(41, 41, 41), show_metrics=False, async_moves=False, ponder=False, should_use_mcts=False, record_path=None):
         """
         Initialize game state
+        :param record_path: append every game to this game record file, abandoned ones as unfinished
         """
         self._BOARD_WIDTH = int(board_width)
         self._BOARD_HEIGHT = int(board_height)
@@ -24,23 +46,63 @@ class Game():
         self.player_o_color = tuple(int(color) for color in player_o_color)
         self._LINE_THICKNESS = int(line_thickness)
         self._SHAPE_THICKNESS = int(shape_thickness)
+        self._SHOW_METRICS = bool(show_metrics)
+
+        # Pre-rendered grid and shapes, built on first draw
+        self._grid_surface = None
+        self._cell_surfaces = None
+        self._dirty_rects = []
+
+        # AI move running on the worker thread as a (future, cancel event) task, and a cancelled one still finishing there
+        self._pending_move = None
+        self._pending_is_pondered = False
+        self._requested_time = 0.0
+        self._is_thinking = False
+        self._shows_thinking = False
+
+        # AI replies computed ahead during the human's turn, by the human's resulting mask
+        self._PONDER = bool(ponder)
+        self._ponder_moves = None
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self.ponder_time_saved = 0.0
 
         self._PLAYER_SHAPES = {}
         self._PLAYER_SHAPES[Game.PLAYER1] = Game.SHAPE_X
         self._PLAYER_SHAPES[Game.PLAYER2] = Game.SHAPE_O
 
+        # Cells filled by the current game, in order
+        self._recorder = game_record.Game_Record_Writer(record_path) if record_path else None
+        self._moves = []
+
         self._should_reset = True
         self._reset()
 
+        self._game_ai, self._ai_engine_id = self._build_ai(should_use_ai, ai_genes, should_use_minimax, should_use_mcts)
+
+        # Pondering searches on an engine of its own, so speculative replies never replace the state of the played one (e.g. the MCTS tree it reuses)
+        self._PONDER = self._PONDER and self._game_ai is not None
+        self._ponder_ai = self._build_ai(should_use_ai, ai_genes, should_use_minimax, should_use_mcts)[0] if self._PONDER else None
+
+        # A single worker keeps the engines' tables free of concurrent searches, pondering runs there too
+        self._executor = ThreadPoolExecutor(max_workers=1) if (bool(async_moves) or self._PONDER) and self._game_ai is not None else None
+
+    @staticmethod
+    def _build_ai(should_use_ai, ai_genes, should_use_minimax, should_use_mcts):
+        """
+        Build the AI engine of player 2
+        :return: a tuple with (the engine or None for a human player 2, its game record engine id)
+        """
         if bool(should_use_ai):
             aggressive_gene = float(ai_genes[0])
             defensive_gene = float(ai_genes[1])
             random_gene = float(ai_genes[2])
-            self._game_ai = Game_AI(aggressive_gene, defensive_gene, random_gene)
+            return Game_AI(aggressive_gene, defensive_gene, random_gene), game_record.ENGINE_IDS['ai']
         elif bool(should_use_minimax):
-            self._game_ai = Game_Minimax()
-        else:
-            self._game_ai = None
+            return Game_Minimax(), game_record.ENGINE_IDS['minimax']
+        elif bool(should_use_mcts):
+            return Game_MCTS(), game_record.ENGINE_IDS['mcts']
+        return None, game_record.ENGINE_IDS['human']
 
     def _set_clicked_position(self, coordinate):
         """
@@ -68,46 +130,144 @@ class Game():
             self._should_reset = True
         elif self._player_1_can_click:
             position = self._set_clicked_position(coordinate)
-            if self._player_1_filled[position[0]][position[1]] == 1 or self._player_2_filled[position[0]][position[1]] == 1:
+            cell = self._board.cell(position[0], position[1])
+            if not self._board.is_legal(cell):
                 return
-            self._player_1_filled[position[0]][position[1]] = 1
+            self._board.move(cell, PLAYER_1)
+            self._moves.append(cell)
             self._clicked_position = position
             self._player_1_can_click = False
             self._player_2_can_click = True
         elif self._game_ai is None and self._player_2_can_click:
             position = self._set_clicked_position(coordinate)
-            if self._player_1_filled[position[0]][position[1]] == 1 or self._player_2_filled[position[0]][position[1]] == 1:
+            cell = self._board.cell(position[0], position[1])
+            if not self._board.is_legal(cell):
                 return
-            self._player_2_filled[position[0]][position[1]] = 1
+            self._board.move(cell, PLAYER_2)
+            self._moves.append(cell)
             self._clicked_position = position
             self._player_2_can_click = False
             self._player_1_can_click = True
 
+    def notify_reset(self):
+        """
+        Notify about a reset request, abandoning any AI move in progress
+        """
+        self._cancel_ai_move()
+        self._should_reset = True
+
+    def close(self):
+        """
+        Cancel any AI move in progress, stop the worker thread and the engines' worker processes, and write the game records
+        """
+        self._cancel_ai_move()
+        if self._executor is not None:
+            # The cancelled search returns early, and the engines are only closed once nothing runs on them
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        for game_ai in (self._game_ai, self._ponder_ai):
+            close = getattr(game_ai, 'close', None)
+            if close is not None:
+                close()
+        if self._recorder is not None:
+            self._record_game(game_record.UNFINISHED)
+            self._recorder.close()
+            self._recorder = None
+
+    def _record_game(self, outcome):
+        """
+        Record the moves of the current game, if any
+        """
+        if self._recorder is not None and len(self._moves) > 0:
+            starting_player = 0 if self._starting_player == Game.PLAYER1 else 1
+            self._recorder.append(self._moves, outcome, starting_player, game_record.ENGINE_IDS['human'], self._ai_engine_id)
+        self._moves = []
+
+    def _mark_dirty(self, rect):
+        """
+        Record a changed screen area to be pushed to the display
+        """
+        self._dirty_rects.append(pygame.Rect(rect))
+
+    def pop_dirty_rects(self):
+        """
+        Return and forget the screen areas changed since the last call
+        """
+        dirty_rects = self._dirty_rects
+        self._dirty_rects = []
+        return dirty_rects
+
+    def is_idle(self):
+        """
+        Check if the game state can only change through a new event
+        """
+        if self._should_reset or self._clicked_position is not None or len(self._dirty_rects) > 0:
+            return False
+        if self._is_thinking != self._shows_thinking:
+            return False
+        if self._PONDER and self._player_1_can_click and self._ponder_moves is None:
+            return False
+        if self._is_over:
+            return self._has_shown_message
+        return not (self._game_ai is not None and self._player_2_can_click)
+
+    def _cell_rect(self, position):
+        """
+        Screen area of a board position
+        """
+        left = int(position[1] * self._BOARD_WIDTH / 3.0)
+        top = int(position[0] * self._BOARD_HEIGHT / 3.0)
+        return pygame.Rect(left, top, self._cell_surfaces[Game.SHAPE_X].get_width(), self._cell_surfaces[Game.SHAPE_X].get_height())
+
+    def _build_surfaces(self):
+        """
+        Pre-render the board grid and the X and O shapes once
+        """
+        self._grid_surface = pygame.Surface((self._BOARD_WIDTH, self._BOARD_HEIGHT))
+        self._grid_surface.fill(self._BACKGROUND)
+        pygame.draw.lines(self._grid_surface, self._LINE_COLOR, False, ((self._BOARD_WIDTH / 3.0, 0), (self._BOARD_WIDTH / 3.0, self._BOARD_HEIGHT)), self._LINE_THICKNESS)
+        pygame.draw.lines(self._grid_surface, self._LINE_COLOR, False, ((2 * self._BOARD_WIDTH / 3.0, 0), (2 * self._BOARD_WIDTH / 3.0, self._BOARD_HEIGHT)), self._LINE_THICKNESS)
+        pygame.draw.lines(self._grid_surface, self._LINE_COLOR, False, ((0, self._BOARD_HEIGHT / 3.0), (self._BOARD_WIDTH, self._BOARD_HEIGHT / 3.0,)), self._LINE_THICKNESS)
+        pygame.draw.lines(self._grid_surface, self._LINE_COLOR, False, ((0, 2 * self._BOARD_HEIGHT / 3.0), (self._BOARD_WIDTH, 2 * self._BOARD_HEIGHT / 3.0,)), self._LINE_THICKNESS)
+
+        cell_width = self._BOARD_WIDTH / 3.0
+        cell_height = self._BOARD_HEIGHT / 3.0
+        cell_size = (int(math.ceil(cell_width)), int(math.ceil(cell_height)))
+
+        shape_x = pygame.Surface(cell_size, pygame.SRCALPHA)
+        x_1 = (1 / 4.0) * cell_width
+        y_1 = (1 / 4.0) * cell_height
+        x_2 = (3 / 4.0) * cell_width
+        y_2 = (3 / 4.0) * cell_height
+        pygame.draw.lines(shape_x, self.player_x_color, False, ((x_1, y_1), (x_2, y_2)), self._SHAPE_THICKNESS+2)
+        pygame.draw.lines(shape_x, self.player_x_color, False, ((x_2, y_1), (x_1, y_2)), self._SHAPE_THICKNESS+3)
+
+        shape_o = pygame.Surface(cell_size, pygame.SRCALPHA)
+        pygame.draw.circle(shape_o, self.player_o_color, (int((1 / 2.0) * cell_width), int((1 / 2.0) * cell_height)), int((3 / 8.0) * cell_height), self._SHAPE_THICKNESS)
+
+        self._cell_surfaces = {Game.SHAPE_X: shape_x, Game.SHAPE_O: shape_o}
+
     def _init_board(self, screen):
         """
         Draws the board grid
         """
-        screen.fill(self._BACKGROUND)
-        pygame.draw.lines(screen, self._LINE_COLOR, False, ((self._BOARD_WIDTH / 3.0, 0), (self._BOARD_WIDTH / 3.0, self._BOARD_HEIGHT)), self._LINE_THICKNESS)
-        pygame.draw.lines(screen, self._LINE_COLOR, False, ((2 * self._BOARD_WIDTH / 3.0, 0), (2 * self._BOARD_WIDTH / 3.0, self._BOARD_HEIGHT)), self._LINE_THICKNESS)
-        pygame.draw.lines(screen, self._LINE_COLOR, False, ((0, self._BOARD_HEIGHT / 3.0), (self._BOARD_WIDTH, self._BOARD_HEIGHT / 3.0,)), self._LINE_THICKNESS)
-        pygame.draw.lines(screen, self._LINE_COLOR, False, ((0, 2 * self._BOARD_HEIGHT / 3.0), (self._BOARD_WIDTH, 2 * self._BOARD_HEIGHT / 3.0,)), self._LINE_THICKNESS)
+        if self._grid_surface is None:
+            self._build_surfaces()
+        screen.blit(self._grid_surface, (0, 0))
+        self._shows_thinking = False
+        self._mark_dirty(screen.get_rect())
 
     def _draw_shape(self, screen):
         """
         Draw the specified shape in the given board position
         """
-        if self._PLAYER_SHAPES[self._current_player] == Game.SHAPE_X:
-            x_1 = self._clicked_position[1] * self._BOARD_WIDTH / 3.0 + ((1 / 4.0) * (self._BOARD_WIDTH / 3.0))
-            y_1 = self._clicked_position[0] * self._BOARD_HEIGHT / 3.0 + ((1 / 4.0) * (self._BOARD_HEIGHT / 3.0))
-            x_2 = self._clicked_position[1] * self._BOARD_WIDTH / 3.0 + ((3 / 4.0) * (self._BOARD_WIDTH / 3.0))
-            y_2 = self._clicked_position[0] * self._BOARD_HEIGHT / 3.0 + ((3 / 4.0) * (self._BOARD_HEIGHT / 3.0))
-            pygame.draw.lines(screen, self.player_x_color, False, ((x_1, y_1), (x_2, y_2)), self._SHAPE_THICKNESS+2)
-            pygame.draw.lines(screen, self.player_x_color, False, ((x_2, y_1), (x_1, y_2)), self._SHAPE_THICKNESS+3)
-        elif self._PLAYER_SHAPES[self._current_player] == Game.SHAPE_O:
-            x = self._clicked_position[1] * self._BOARD_WIDTH / 3.0 + ((1 / 2.0) * (self._BOARD_WIDTH / 3.0))
-            y = self._clicked_position[0] * self._BOARD_HEIGHT / 3.0 + ((1 / 2.0) * (self._BOARD_HEIGHT / 3.0))
-            pygame.draw.circle(screen, self.player_o_color, (int(x), int(y)), int((3 / 8.0) * (self._BOARD_HEIGHT / 3.0)), self._SHAPE_THICKNESS)
+        if self._grid_surface is None:
+            self._build_surfaces()
+        shape = self._PLAYER_SHAPES[self._current_player]
+        if shape in self._cell_surfaces:
+            rect = self._cell_rect(self._clicked_position)
+            screen.blit(self._cell_surfaces[shape], rect)
+            self._mark_dirty(rect)
 
     def _show_winner(self, screen, font='Arial', font_size=50, font_color=(0, 0, 255)):
         """
@@ -117,7 +277,7 @@ class Game():
         message = self._winning_player + ' WINS!!!' if self._winning_player is not None else 'IT\'S A TIE!'
         message_x = self._BOARD_WIDTH / 2.0 - ((len(message) / 78.0) * self._BOARD_WIDTH)
         message_y = self._BOARD_HEIGHT / 2.0 - ((1 / 20.0) * self._BOARD_HEIGHT)
-        screen.blit(pygame.font.SysFont(font, font_size).render(message, False, font_color, self._BACKGROUND), (message_x, message_y))
+        self._mark_dirty(screen.blit(_get_font(font, font_size).render(message, False, font_color, self._BACKGROUND), (message_x, message_y)))
 
     def draw(self, screen):
         """
@@ -132,11 +292,46 @@ class Game():
         if self._is_over and not self._has_shown_message:
             self._show_winner(screen)
             self._has_shown_message = True
+        if self._is_thinking != self._shows_thinking:
+            self._show_thinking(screen)
+        # The timings only change when something else was drawn
+        if self._SHOW_METRICS and metrics.ENABLED and len(self._dirty_rects) > 0:
+            self._show_metrics(screen)
+
+    def _show_thinking(self, screen, font='Arial', font_size=16, font_color=(120, 120, 120)):
+        """
+        Displays or clears the ai thinking label in the top left corner
+        """
+        text = _get_font(font, font_size).render('AI THINKING...', False, font_color, self._BACKGROUND)
+        rect = pygame.Rect(4, 4, text.get_width(), text.get_height())
+        if self._is_thinking:
+            screen.blit(text, rect)
+        else:
+            screen.blit(self._grid_surface, rect, rect)
+        self._shows_thinking = self._is_thinking
+        self._mark_dirty(rect)
+
+    def _show_metrics(self, screen, font='Arial', font_size=16, font_color=(120, 120, 120)):
+        """
+        Displays the frame and ai move timings in the bottom left corner
+        """
+        frame = metrics.histogram('game.frame')
+        ai_move = metrics.histogram('game.ai_move')
+        message = 'frame {0:.1f} ms'.format(1000.0 * frame.last if frame is not None else 0.0)
+        if ai_move is not None:
+            message += ' | ai move {0:.1f} ms (p95 {1:.1f} ms)'.format(1000.0 * ai_move.last, 1000.0 * ai_move.percentile(0.95))
+        text = _get_font(font, font_size).render(message, False, font_color, self._BACKGROUND)
+        rect = pygame.Rect(4, self._BOARD_HEIGHT - text.get_height() - 4, self._BOARD_WIDTH / 2.0, text.get_height())
+        screen.fill(self._BACKGROUND, rect)
+        screen.blit(text, rect)
+        self._mark_dirty(rect)
 
     def _reset(self, starting_player=PLAYER2):
         """
         Reset the game state
         """
+        self._record_game(game_record.UNFINISHED)
+        self._starting_player = starting_player
         self._is_over = False
         self._has_shown_message = False
         self._current_player = starting_player
@@ -144,9 +339,9 @@ class Game():
         self._player_1_can_click = self._current_player == Game.PLAYER1
         self._player_2_can_click = self._current_player == Game.PLAYER2
         self._clicked_position = None
+        self._is_thinking = False
 
-        self._player_1_filled = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
-        self._player_2_filled = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
+        self._board = Board(3)
 
     def _check_if_game_over(self):
         """
@@ -155,28 +350,146 @@ class Game():
         if self._is_over:
             return True
         self._is_over = False
-        for i in range(3):
-            if (sum([self._player_1_filled[i][j] for j in range(3)]) > 2) or (sum([self._player_1_filled[j][i] for j in range(3)]) > 2):
-                self._is_over = True
-                self._winning_player = Game.PLAYER1
-                return True
-            elif (sum([self._player_2_filled[i][j] for j in range(3)]) > 2) or (sum([self._player_2_filled[j][i] for j in range(3)]) > 2):
-                self._is_over = True
-                self._winning_player = Game.PLAYER2
-                return True
-        if (self._player_1_filled[0][0] + self._player_1_filled[1][1] + self._player_1_filled[2][2] > 2) or (self._player_1_filled[0][2] + self._player_1_filled[1][1] + self._player_1_filled[2][0] > 2):
+        winner = self._board.winner()
+        if winner == PLAYER_1:
             self._is_over = True
             self._winning_player = Game.PLAYER1
             return True
-        if (self._player_2_filled[0][0] + self._player_2_filled[1][1] + self._player_2_filled[2][2] > 2) or (self._player_2_filled[0][2] + self._player_2_filled[1][1] + self._player_2_filled[2][0] > 2):
+        elif winner == PLAYER_2:
             self._is_over = True
             self._winning_player = Game.PLAYER2
             return True
-        if sum([sum([self._player_1_filled[i][j] for i in range(3)]) for j in range(3)]) + sum([sum([self._player_2_filled[i][j] for i in range(3)]) for j in range(3)]) > 8:
+        elif winner is not None:
             self._is_over = True
             return True
         return False
 
+    def _choose_ai_cell(self, game_ai, self_mask, opponent_mask, cancel_event=None):
+        """
+        AI move choice of an engine with the times it started and ended
+        :return: a tuple with (the chosen cell, start time, end time)
+        """
+        start_time = time.perf_counter()
+        cell = game_ai.choose_cell(self_mask, opponent_mask, cancel_event=cancel_event)
+        return cell, start_time, time.perf_counter()
+
+    def _submit_ai_move(self, game_ai, self_mask, opponent_mask):
+        """
+        Queue an AI move choice of an engine on the worker thread with a cancel event of its own, so cancelling it never stops another search
+        :return: a tuple with (the future, its cancel event)
+        """
+        cancel_event = threading.Event()
+        return self._executor.submit(self._choose_ai_cell, game_ai, self_mask, opponent_mask, cancel_event), cancel_event
+
+    def _poll_ai_move(self):
+        """
+        Dispatch the AI move to the worker thread if needed, without waiting for it
+        :return: a tuple with (whether the move is ready, the chosen cell)
+        """
+        if self._pending_move is None:
+            self._requested_time = time.perf_counter()
+            pondered_move = None if self._ponder_moves is None else self._ponder_moves.pop(self._board.filled[PLAYER_1], None)
+            self._stop_pondering()
+            if pondered_move is not None:
+                self._pending_move = pondered_move
+            else:
+                # The single worker runs it after any cancelled search has returned
+                self._pending_move = self._submit_ai_move(self._game_ai, self._board.filled[PLAYER_2], self._board.filled[PLAYER_1])
+            self._pending_is_pondered = pondered_move is not None
+            self._is_thinking = True
+            return False, None
+        future, _ = self._pending_move
+        if not future.done():
+            return False, None
+        cell, start_time, end_time = future.result()
+        if self._PONDER:
+            self._record_ponder(start_time, end_time)
+        if metrics.ENABLED:
+            # Perceived latency, zero for a reply pondered to the end
+            metrics.observe('game.ai_move', max(0.0, end_time - max(start_time, self._requested_time)))
+        self._pending_move = None
+        self._is_thinking = False
+        return True, cell
+
+    def _cancel_task(self, task):
+        """
+        Cancel a worker task, setting its own cancel event to stop its search early if it is already running
+        """
+        future, cancel_event = task
+        if not future.cancel():
+            cancel_event.set()
+
+    def _cancel_ai_move(self):
+        """
+        Abandon the AI move and the pondering in progress
+        """
+        self._stop_pondering()
+        if self._pending_move is None:
+            return
+        self._cancel_task(self._pending_move)
+        self._pending_move = None
+        self._is_thinking = False
+
+    def _start_pondering(self):
+        """
+        Queue the AI reply to every human move on the worker thread while the human is thinking
+        """
+        self._ponder_moves = {}
+        self_mask = self._board.filled[PLAYER_2]
+        for cell in self._board.empty_cells():
+            # No reply is needed after a move ending the game
+            if self._board.wins_with(cell, PLAYER_1) or self._board.empty() == (1 << cell):
+                continue
+            opponent_mask = self._board.filled[PLAYER_1] | (1 << cell)
+            self._ponder_moves[opponent_mask] = self._submit_ai_move(self._ponder_ai, self_mask, opponent_mask)
+
+    def _stop_pondering(self):
+        """
+        Cancel the replies pondered for this turn
+        """
+        if self._ponder_moves is None:
+            return
+        for task in self._ponder_moves.values():
+            if not task[0].done():
+                self._cancel_task(task)
+        self._ponder_moves = None
+
+    def _record_ponder(self, start_time, end_time):
+        """
+        Count an AI reply as a pondering hit or miss, with the search time it saved
+        """
+        if self._pending_is_pondered:
+            saved_time = max(0.0, min(end_time, self._requested_time) - start_time)
+            self.ponder_hits += 1
+            self.ponder_time_saved += saved_time
+        else:
+            self.ponder_misses += 1
+        if metrics.ENABLED:
+            metrics.count('game.ponder_hits' if self._pending_is_pondered else 'game.ponder_misses')
+            if self._pending_is_pondered:
+                metrics.observe('game.ponder_saved', saved_time)
+
+    def ponder_stats(self):
+        """
+        Pondering hits, misses, hit rate and total seconds of search the hits saved
+        """
+        replies = self.ponder_hits + self.ponder_misses
+        return {'hits': self.ponder_hits, 'misses': self.ponder_misses, 'hit_rate': self.ponder_hits / float(replies) if replies > 0 else 0.0, 'time_saved': self.ponder_time_saved}
+
+    def _end_game_if_over(self):
+        """
+        Stop the game and record it if the last move ended it
+        :return: whether the game is over
+        """
+        if not self._check_if_game_over():
+            return False
+        self._stop_pondering()
+        self._record_game({Game.PLAYER1: game_record.PLAYER_1_WINS, Game.PLAYER2: game_record.PLAYER_2_WINS}.get(self._winning_player, game_record.TIE))
+        self._player_1_can_click = False
+        self._player_2_can_click = False
+        self._clicked_position = None
+        return True
+
     def update(self, screen):
         """
         Update the game state
@@ -186,15 +499,21 @@ class Game():
             self._should_reset = False
         elif self._is_over:
             return
-        elif self._check_if_game_over():
-            self._is_over = True
-            self._player_1_can_click = False
-            self._player_2_can_click = False
-            self._clicked_position = None
+        elif self._end_game_if_over():
+            return
         elif self._game_ai is not None and self._player_2_can_click:
-            position = self._game_ai.choose_position(self._player_2_filled, self._player_1_filled)
-            if position is not None:
-                self._player_2_filled[position[0]][position[1]] = 1
+            if self._executor is None:
+                cell, start_time, end_time = self._choose_ai_cell(self._game_ai, self._board.filled[PLAYER_2], self._board.filled[PLAYER_1])
+                if metrics.ENABLED:
+                    metrics.observe('game.ai_move', end_time - start_time)
+            else:
+                is_ready, cell = self._poll_ai_move()
+                if not is_ready:
+                    return
+            if cell is not None:
+                position = self._board.position(cell)
+                self._board.move(cell, PLAYER_2)
+                self._moves.append(cell)
                 self._clicked_position = position
                 self._current_player = Game.PLAYER2
                 self._draw_shape(screen)
@@ -202,3 +521,7 @@ class Game():
             self._player_1_can_click = True
             self._clicked_position = None
             self._current_player = Game.PLAYER1
+            # Ended before the loop can sleep or take another click, since the game looks idle to it from here on
+            self._end_game_if_over()
+        elif self._PONDER and self._player_1_can_click and self._ponder_moves is None:
+            self._start_pondering()
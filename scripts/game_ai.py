@@ -1,149 +1,129 @@
 import numpy as np
-import random
+
+from batch_simulator import choose_cells, split_boards
+from board import lists_to_mask, mask_cells
+from line_index import Line_Index
+import metrics
+from policy_table import AGGRESSIVE, DEFENSIVE, RANDOM, Policy_Table
+from random_stream import as_stream, cumulative_probabilities
+
+
+# Largest board whose candidates are memoized per position in the shared policy table, bigger boards use an incremental line index
+_POLICY_TABLE_MAX_SIZE = 3
 
 
 class Game_AI():
 
-    def __init__(self, aggressive_gene, defensive_gene, random_gene, board_size=3):
+    _CHOICE_NAMES = {AGGRESSIVE: 'Aggressive Choice', DEFENSIVE: 'Defensive Choice', RANDOM: 'Random Choice'}
+
+    def __init__(self, aggressive_gene, defensive_gene, random_gene, board_size=3, rng=None, win_length=None):
         """
-        Initialize AI
+        Initialize AI for k-in-a-row on an NxN board
+        :param rng: Random_Stream of the choices, or its seed (None, an int or a SeedSequence)
         """
         self._AGGRESSIVE_GENE = int(aggressive_gene)
         self._DEFENSIVE_GENE = int(defensive_gene)
         self._RANDOM_GENE = int(random_gene)
+        self._STRATEGY_PROBABILITIES = [self._AGGRESSIVE_GENE / 100.0, self._DEFENSIVE_GENE / 100.0, self._RANDOM_GENE / 100.0]
+        self._STRATEGY_CUMULATIVE = cumulative_probabilities(self._STRATEGY_PROBABILITIES)
+        self._STRATEGY_THRESHOLDS = np.array([self._AGGRESSIVE_GENE, self._AGGRESSIVE_GENE + self._DEFENSIVE_GENE], dtype=np.float64) / 100.0
 
         self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._FULL_MASK = (1 << (self._BOARD_SIZE * self._BOARD_SIZE)) - 1
+        if self._WIN_LENGTH == self._BOARD_SIZE and self._BOARD_SIZE <= _POLICY_TABLE_MAX_SIZE:
+            self._policy_table = Policy_Table.shared(self._BOARD_SIZE)
+            self._line_index = None
+        else:
+            self._policy_table = None
+            self._line_index = Line_Index(self._BOARD_SIZE, self._WIN_LENGTH)
+        self._rng = as_stream(rng)
 
-    def _make_aggressive_choice(self, self_filled, opponent_filled, possible_positions, log_choice):
-        """
-        Make aggressive position choice
-        """
-        rows = {}
-        cols = {}
-        max_diags_1 = {}
-        max_diags_2 = {}
-        for i in range(self._BOARD_SIZE):
-            rows[i] = []
-            cols[i] = []
-            max_diags_1[i] = False
-            max_diags_2[i] = False
-        for i in range(self._BOARD_SIZE):
-            count = sum([self_filled[i][j] for j in range(self._BOARD_SIZE)])
-            rows[count].append(i)
-            count = sum([self_filled[j][i] for j in range(self._BOARD_SIZE)])
-            cols[count].append(i)
-        count = sum([self_filled[j][j] for j in range(self._BOARD_SIZE)])
-        max_diags_1[count] = True
-        count = sum([self_filled[self._BOARD_SIZE - 1 - j][j] for j in range(self._BOARD_SIZE)])
-        max_diags_2[count] = True
-
-        for count in range(self._BOARD_SIZE - 1, -1, -1):
-            position_choices = []
-            if len(rows[count]) > 0:
-                for row in rows[count]:
-                    if sum([opponent_filled[row][j] for j in range(self._BOARD_SIZE)]) == 0:
-                        position_choices.extend([[row, j] for j in range(self._BOARD_SIZE) if possible_positions[row][j] == 1])
-            if len(cols[count]) > 0:
-                for col in cols[count]:
-                    if sum([opponent_filled[j][col] for j in range(self._BOARD_SIZE)]) == 0:
-                        position_choices.extend([[j, col] for j in range(self._BOARD_SIZE) if possible_positions[j][col] == 1])
-            if max_diags_1[count]:
-                if sum([opponent_filled[j][j] for j in range(self._BOARD_SIZE)]) == 0:
-                    position_choices.extend([[j, j] for j in range(self._BOARD_SIZE) if possible_positions[j][j] == 1])
-            if max_diags_2[count]:
-                if sum([opponent_filled[self._BOARD_SIZE - 1 - j][j] for j in range(self._BOARD_SIZE)]) == 0:
-                    position_choices.extend([[self._BOARD_SIZE - 1 - j, j] for j in range(self._BOARD_SIZE) if possible_positions[self._BOARD_SIZE - 1 - j][j] == 1])
-            if len(position_choices) > 0:
-                if log_choice:
-                    print('Aggressive Choice')
-                    print(position_choices)
-                return position_choices[random.randint(0, len(position_choices) - 1)]
-
-        return self._make_random_choice(self_filled, opponent_filled, possible_positions, log_choice)
-
-    def _make_defensive_choice(self, self_filled, opponent_filled, possible_positions, log_choice):
+    def _position(self, cell):
         """
-        Make defensive position choice
+        (row, col) position of a cell index
         """
-        rows = {}
-        cols = {}
-        max_diags_1 = {}
-        max_diags_2 = {}
-        for i in range(self._BOARD_SIZE):
-            rows[i] = []
-            cols[i] = []
-            max_diags_1[i] = False
-            max_diags_2[i] = False
-        for i in range(self._BOARD_SIZE):
-            count = sum([opponent_filled[i][j] for j in range(self._BOARD_SIZE)])
-            rows[count].append(i)
-            count = sum([opponent_filled[j][i] for j in range(self._BOARD_SIZE)])
-            cols[count].append(i)
-        count = sum([opponent_filled[j][j] for j in range(self._BOARD_SIZE)])
-        max_diags_1[count] = True
-        count = sum([opponent_filled[self._BOARD_SIZE - 1 - j][j] for j in range(self._BOARD_SIZE)])
-        max_diags_2[count] = True
-
-        for count in range(self._BOARD_SIZE - 1, -1, -1):
-            position_choices = []
-            if len(rows[count]) > 0:
-                for row in rows[count]:
-                    if sum([self_filled[row][j] for j in range(self._BOARD_SIZE)]) == 0:
-                        position_choices.extend([[row, j] for j in range(self._BOARD_SIZE) if possible_positions[row][j] == 1])
-            if len(cols[count]) > 0:
-                for col in cols[count]:
-                    if sum([self_filled[j][col] for j in range(self._BOARD_SIZE)]) == 0:
-                        position_choices.extend([[j, col] for j in range(self._BOARD_SIZE) if possible_positions[j][col] == 1])
-            if max_diags_1[count]:
-                if sum([self_filled[j][j] for j in range(self._BOARD_SIZE)]) == 0:
-                    position_choices.extend([[j, j] for j in range(self._BOARD_SIZE) if possible_positions[j][j] == 1])
-            if max_diags_2[count]:
-                if sum([self_filled[self._BOARD_SIZE - 1 - j][j] for j in range(self._BOARD_SIZE)]) == 0:
-                    position_choices.extend([[self._BOARD_SIZE - 1 - j, j] for j in range(self._BOARD_SIZE) if possible_positions[self._BOARD_SIZE - 1 - j][j] == 1])
-            if len(position_choices) > 0:
-                if log_choice:
-                    print('Defensive Choice')
-                    print(position_choices)
-                return position_choices[random.randint(0, len(position_choices) - 1)]
-
-        return self._make_random_choice(self_filled, opponent_filled, possible_positions, log_choice)
-
-    def _make_random_choice(self, self_filled, opponent_filled, possible_positions, log_choice):
+        return [cell // self._BOARD_SIZE, cell % self._BOARD_SIZE]
+
+    def _make_choice(self, candidates, strategy, log_choice):
         """
-        Make random position choice
+        Make a position choice among the strategy's candidates, falling back to a random choice when it has none
         """
+        position_choices = candidates[strategy]
+        if len(position_choices) == 0:
+            strategy = RANDOM
+            position_choices = candidates[RANDOM]
         if log_choice:
-            print('Random Choice')
-        positions = []
-        for i in range(self._BOARD_SIZE):
-            for j in range(self._BOARD_SIZE):
-                if possible_positions[i][j] == 1:
-                    positions.append([i, j])
-        return positions[random.randint(0, len(positions) - 1)]
+            print(self._CHOICE_NAMES[strategy])
+            if strategy != RANDOM:
+                print([self._position(cell) for cell in position_choices])
+        return position_choices[self._rng.index(len(position_choices))]
 
-    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+    def choose_cell(self, self_mask, opponent_mask, log_choice=False, cancel_event=None):
         """
-        Choose the next fill position
+        Choose the next fill cell index on the bitboard representation
+        :param cancel_event: ignored, the choice runs no search to stop
         """
-        is_board_empty = True
-        is_board_full = True
-        possible_positions = [[0 for j in range(self._BOARD_SIZE)] for i in range(self._BOARD_SIZE)]
-        for i in range(self._BOARD_SIZE):
-            for j in range(self._BOARD_SIZE):
-                if self_filled[i][j] == 0 and opponent_filled[i][j] == 0:
-                    possible_positions[i][j] = 1
-                    is_board_full = False
-                else:
-                    is_board_empty = False
+        empty_mask = self._FULL_MASK & ~(self_mask | opponent_mask)
 
-        # Empty Board
-        if is_board_empty:
-            return self._make_random_choice(self_filled, opponent_filled, possible_positions, log_choice)
         # Filled Board
-        elif is_board_full:
+        if empty_mask == 0:
             return
+        if self._line_index is not None:
+            return self._choose_indexed_cell(self_mask, opponent_mask, empty_mask, log_choice)
+        candidates = self._policy_table.candidates(self_mask, opponent_mask)
+        # Empty Board
+        if empty_mask == self._FULL_MASK:
+            return self._make_choice(candidates, RANDOM, log_choice)
         # Normal Board
         else:
-            choice_function = list(np.random.choice([self._make_aggressive_choice, self._make_defensive_choice, self._make_random_choice], 1,
-                                                    p=[self._AGGRESSIVE_GENE / 100.0, self._DEFENSIVE_GENE / 100.0, self._RANDOM_GENE / 100.0]))[0]
-            return choice_function(self_filled, opponent_filled, possible_positions, log_choice)
+            strategy = self._rng.weighted_index(self._STRATEGY_CUMULATIVE)
+            return self._make_choice(candidates, strategy, log_choice)
+
+    def _choose_indexed_cell(self, self_mask, opponent_mask, empty_mask, log_choice):
+        """
+        Choose a cell from the line index: a uniform line among the best open ones, then a uniform empty cell of it,
+        which draws each (line, cell) candidate with the same probability as the policy table
+        """
+        self._line_index.sync(self_mask, opponent_mask)
+        strategy = RANDOM if empty_mask == self._FULL_MASK else self._rng.weighted_index(self._STRATEGY_CUMULATIVE)
+        if strategy != RANDOM:
+            lines = self._line_index.best_open_lines(0 if strategy == AGGRESSIVE else 1)
+            if len(lines) == 0:
+                strategy = RANDOM
+        if log_choice:
+            print(self._CHOICE_NAMES[strategy])
+            if strategy != RANDOM:
+                print([self._position(cell) for line in lines for cell in self._line_index.empty_cells(line)])
+        if strategy == RANDOM:
+            position_choices = mask_cells(empty_mask)
+        else:
+            position_choices = self._line_index.empty_cells(lines[self._rng.index(len(lines))])
+        return position_choices[self._rng.index(len(position_choices))]
+
+    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+        """
+        Choose the next fill position
+        """
+        cell = self.choose_cell(lists_to_mask(self_filled), lists_to_mask(opponent_filled), log_choice)
+        if cell is None:
+            return
+        return self._position(cell)
+
+    def choose_positions(self, boards, rng=None):
+        """
+        Choose the next fill position of many boards at once
+        :param boards: an (N, cells) or (N, n, n) array, positive for the ai's cells, negative for the opponent's and 0 for empty cells
+        :param rng: numpy Generator of the choices, the ai's own stream by default
+        :return: an (N, 2) array of (row, col) positions, (-1, -1) for full boards
+        """
+        rng = self._rng.generator if rng is None else rng
+        own, other = split_boards(boards, self._BOARD_SIZE)
+        thresholds = np.broadcast_to(self._STRATEGY_THRESHOLDS, (len(own), 2))
+        cells = choose_cells(own, other, thresholds, self._BOARD_SIZE, rng, self._WIN_LENGTH)
+        positions = np.stack([cells // self._BOARD_SIZE, cells % self._BOARD_SIZE], axis=1)
+        positions[(own + other).all(axis=1)] = -1
+        return positions
+
+
+metrics.register(Game_AI, 'choose_cell', 'game_ai.choose_cell')
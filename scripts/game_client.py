@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import numpy as np
+import random
+import time
+
+from board import mask_cells
+from game_server import DEFAULT_HOST, DEFAULT_PORT
+
+
+async def _request(reader, writer, request, latencies):
+    """
+    Send one json line request and wait for its answer, appending the round trip latency
+    """
+    start_time = time.perf_counter()
+    writer.write((json.dumps(request) + '\n').encode())
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    latencies.append(time.perf_counter() - start_time)
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response
+
+
+async def _play_session(host, port, unix_path, engine_name, games, rng, move_latencies, ai_latencies):
+    """
+    Play games against the server over one connection, the client moving uniformly at random
+    :return: the number of games played
+    """
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for game in range(games):
+            response = await _request(reader, writer, {'op': 'new', 'engine': engine_name, 'ai_starts': game % 2 == 1}, move_latencies)
+            state = response['state']
+            while state['winner'] is None:
+                if state['turn'] == 0:
+                    empty_cells = mask_cells(0x1FF & ~(state['filled'][0] | state['filled'][1]))
+                    response = await _request(reader, writer, {'op': 'move', 'session': state['session'], 'cell': rng.choice(empty_cells)}, move_latencies)
+                else:
+                    response = await _request(reader, writer, {'op': 'ai_move', 'session': state['session']}, ai_latencies)
+                state = response['state']
+            await _request(reader, writer, {'op': 'close', 'session': state['session']}, move_latencies)
+    finally:
+        writer.close()
+    return games
+
+
+async def _load(host, port, unix_path, engine_name, clients, games, seed):
+    """
+    Run the concurrent clients
+    """
+    move_latencies = []
+    ai_latencies = []
+    rng = random.Random(seed)
+    sessions = await asyncio.gather(*[_play_session(host, port, unix_path, engine_name, games, random.Random(rng.random()), move_latencies, ai_latencies) for _ in range(clients)])
+    return sum(sessions), move_latencies, ai_latencies
+
+
+def main(host, port, unix_path, engine_name, clients, games, seed):
+    """
+    Load generator for the game server
+    """
+    print('### STARTING {0} CLIENTS OF {1} GAMES AGAINST {2} ###'.format(clients, games, engine_name))
+
+    start_time = time.time()
+    sessions, move_latencies, ai_latencies = asyncio.run(_load(host, port, unix_path, engine_name, clients, games, seed))
+    elapsed_time = time.time() - start_time
+
+    print('### LOAD TOOK {0} SECONDS ###'.format(round(elapsed_time, 1)))
+    print('Sessions handled: {0} ({1} sessions/sec), requests: {2} ({3} requests/sec)'.format(sessions, int(sessions / elapsed_time), len(move_latencies) + len(ai_latencies), int((len(move_latencies) + len(ai_latencies)) / elapsed_time)))
+    for name, latencies in (('new/move/close', move_latencies), ('ai_move', ai_latencies)):
+        if len(latencies) > 0:
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000.0, [50, 95, 99])
+            print('{0} latency p50/p95/p99: {1:.3f}/{2:.3f}/{3:.3f} ms'.format(name, p50, p95, p99))
+
+
+def run(host, port, unix_path, engine_name, clients, games, seed):
+    """
+    Run the program using the cli inputs
+    """
+    main(host, int(port), unix_path, engine_name, int(clients), int(games), seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Server Load Generator')
+    parser.add_argument('--host', dest='host', default=DEFAULT_HOST, help='Tcp host of the server')
+    parser.add_argument('--port', dest='port', type=int, default=DEFAULT_PORT, help='Tcp port of the server')
+    parser.add_argument('-u', '--unix', dest='unix', default=None, help='Connect to this unix socket path instead of tcp')
+    parser.add_argument('-e', '--engine', dest='engine', default='minimax', choices=['ai', 'minimax'], help='Engine to play against')
+    parser.add_argument('-c', '--clients', dest='clients', type=int, default=50, help='Concurrent client connections')
+    parser.add_argument('-n', '--games', dest='games', type=int, default=20, help='Games played by each client')
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=None, help='Seed the client moves')
+    args = parser.parse_args()
+
+    try:
+        run(args.host, args.port, args.unix, args.engine, args.clients, args.games, args.seed)
+    except Exception as e:
+        print(e)
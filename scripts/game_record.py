@@ -0,0 +1,304 @@
+import argparse
+from array import array
+import os
+import struct
+import time
+
+
+GAME_RECORDS_PATH = os.path.join(os.path.dirname(__file__), '../data/game_records.bin')
+
+# Header: magic, version, board size, win length, 64-bit words per record; records follow as little-endian words
+_HEADER = struct.Struct('<4sBBBB')
+_MAGIC = b'TTTG'
+_VERSION = 1
+
+# Outcomes
+PLAYER_1_WINS = 0
+PLAYER_2_WINS = 1
+TIE = 2
+UNFINISHED = 3
+
+# Engine ids of the players
+ENGINE_IDS = {'human': 0, 'ai': 1, 'minimax': 2, 'mcts': 3, 'random': 4}
+
+# First word: move count (8 bits), outcome (2), starting player (1), player 1 and player 2 engine ids (8 each), then the moves.
+# Moves never straddle two words, so a 3x3 game of 4-bit cells fits one word
+_MOVES_SHIFT = 27
+
+# Records scanned at once by the statistics, bounding the memory of their arrays
+_SCAN_CHUNK_RECORDS = 1 << 20
+
+_LAYOUTS = {}
+
+
+def _layout(board_size):
+    """
+    Build (and cache) the bits per cell and the (word, shift) slot of every move of a board's records
+    """
+    if board_size not in _LAYOUTS:
+        cells = board_size * board_size
+        cell_bits = max((cells - 1).bit_length(), 1)
+        slots = []
+        word = 0
+        shift = _MOVES_SHIFT
+        for _ in range(cells):
+            if shift + cell_bits > 64:
+                word += 1
+                shift = 0
+            slots.append((word, shift))
+            shift += cell_bits
+        _LAYOUTS[board_size] = (cell_bits, tuple(slots), word + 1)
+    return _LAYOUTS[board_size]
+
+
+def pack_record(moves, outcome, starting_player, engine_1, engine_2, board_size=3):
+    """
+    Pack a game into its record words
+    :param moves: the cells filled in order, starting with starting_player (0 for player 1, 1 for player 2)
+    :param engine_1: engine id of player 1
+    """
+    _, slots, words_per_record = _layout(board_size)
+    words = [0] * words_per_record
+    words[0] = len(moves) | (outcome << 8) | (starting_player << 10) | (engine_1 << 11) | (engine_2 << 19)
+    for cell, (word, shift) in zip(moves, slots):
+        words[word] |= cell << shift
+    return words
+
+
+class Game_Record_Writer():
+
+    def __init__(self, game_records_path=GAME_RECORDS_PATH, board_size=3, win_length=None, buffer_records=4096):
+        """
+        Open a game record file for appending, buffering records so they reach the file in bulk writes;
+        a record cut short by a crash while writing is dropped
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._WORDS_PER_RECORD = _layout(self._BOARD_SIZE)[2]
+        self._BUFFER_WORDS = max(int(buffer_records), 1) * self._WORDS_PER_RECORD
+
+        self._file = open(game_records_path, 'ab')
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(_HEADER.pack(_MAGIC, _VERSION, self._BOARD_SIZE, self._WIN_LENGTH, self._WORDS_PER_RECORD))
+        else:
+            with open(game_records_path, 'rb') as records_file:
+                header = records_file.read(_HEADER.size)
+            if len(header) < _HEADER.size or _HEADER.unpack(header) != (_MAGIC, _VERSION, self._BOARD_SIZE, self._WIN_LENGTH, self._WORDS_PER_RECORD):
+                self._file.close()
+                raise ValueError('{0} is not a version {1} record file of {2}x{2} k{3} games'.format(game_records_path, _VERSION, self._BOARD_SIZE, self._WIN_LENGTH))
+            # A record cut short by a crash while writing is dropped, or every record appended after it would be misaligned
+            records_end = size - (size - _HEADER.size) % (8 * self._WORDS_PER_RECORD)
+            if records_end != size:
+                self._file.truncate(records_end)
+                self._file.seek(records_end)
+        self._buffer = array('Q')
+        self.records = 0
+
+    def append(self, moves, outcome, starting_player, engine_1, engine_2):
+        """
+        Record a game
+        """
+        self.extend(pack_record(moves, outcome, starting_player, engine_1, engine_2, self._BOARD_SIZE))
+
+    def extend(self, words):
+        """
+        Record games already packed by pack_record, e.g. in worker processes
+        """
+        self._buffer.extend(words)
+        self.records += len(words) // self._WORDS_PER_RECORD
+        if len(self._buffer) >= self._BUFFER_WORDS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records
+        """
+        if len(self._buffer) > 0:
+            self._file.write(self._buffer.tobytes())
+            self._buffer = array('Q')
+        self._file.flush()
+
+    def size(self):
+        """
+        Write the buffered records and return the file size, e.g. to truncate the file back to it later
+        """
+        self.flush()
+        return self._file.tell()
+
+    def close(self):
+        """
+        Write the buffered records and close the file
+        """
+        self.flush()
+        self._file.close()
+
+
+class Game_Records():
+
+    def __init__(self, game_records_path=GAME_RECORDS_PATH):
+        """
+        Memory-map a game record file; a record cut short by a crash while writing is ignored
+        """
+        # Only readers pay for the numpy import
+        import numpy as np
+
+        with open(game_records_path, 'rb') as records_file:
+            magic, version, board_size, win_length, words_per_record = _HEADER.unpack(records_file.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('{0} is not a version {1} game record file'.format(game_records_path, _VERSION))
+        self.board_size = board_size
+        self.win_length = win_length
+        self._CELLS = board_size * board_size
+        self._CELL_BITS, self._SLOTS, _ = _layout(board_size)
+
+        count = (os.path.getsize(game_records_path) - _HEADER.size) // (8 * words_per_record)
+        # Records as an (N, words) view of the file
+        self.records = np.memmap(game_records_path, dtype='<u8', mode='r', offset=_HEADER.size, shape=(count, words_per_record)) if count > 0 else \
+            np.zeros((0, words_per_record), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.records)
+
+    def move_counts(self, start=0, stop=None):
+        """
+        Moves of each game
+        """
+        return (self.records[start:stop, 0] & 0xFF).astype('i8')
+
+    def outcomes(self, start=0, stop=None):
+        """
+        Outcome of each game: PLAYER_1_WINS, PLAYER_2_WINS, TIE or UNFINISHED
+        """
+        return ((self.records[start:stop, 0] >> 8) & 0x3).astype('i8')
+
+    def starting_players(self, start=0, stop=None):
+        """
+        Player of each game's first move, 0 for player 1 and 1 for player 2
+        """
+        return ((self.records[start:stop, 0] >> 10) & 0x1).astype('i8')
+
+    def engines(self, start=0, stop=None):
+        """
+        (N, 2) engine ids of each game's players
+        """
+        import numpy as np
+
+        first_words = self.records[start:stop, 0]
+        return np.stack([(first_words >> 11) & 0xFF, (first_words >> 19) & 0xFF], axis=1).astype('i8')
+
+    def moves(self, start=0, stop=None):
+        """
+        (N, cells) cells filled by each game in order, -1 after its last move
+        """
+        import numpy as np
+
+        records = self.records[start:stop]
+        moves = np.empty((len(records), self._CELLS), dtype='i8')
+        for ply in range(self._CELLS):
+            moves[:, ply] = self._ply_cells(records, ply)
+        moves[np.arange(self._CELLS) >= self.move_counts(start, stop)[:, None]] = -1
+        return moves
+
+    def _chunks(self):
+        """
+        (start, stop) record ranges scanned at once
+        """
+        return [(start, min(start + _SCAN_CHUNK_RECORDS, len(self))) for start in range(0, len(self), _SCAN_CHUNK_RECORDS)]
+
+    def outcome_counts(self):
+        """
+        Games per outcome
+        """
+        import numpy as np
+
+        counts = np.zeros(4, dtype='i8')
+        for start, stop in self._chunks():
+            counts += np.bincount(self.outcomes(start, stop), minlength=4)
+        return counts
+
+    def _ply_cells(self, records, ply):
+        """
+        Cells filled at a ply of each of the records, meaningless past their last move
+        """
+        import numpy as np
+
+        word, shift = self._SLOTS[ply]
+        return ((records[:, word] >> np.uint64(shift)) & np.uint64((1 << self._CELL_BITS) - 1)).astype(np.intp)
+
+    def opening_frequencies(self):
+        """
+        Games opened on each cell
+        """
+        import numpy as np
+
+        counts = np.zeros(self._CELLS, dtype='i8')
+        for start, stop in self._chunks():
+            is_started = self.move_counts(start, stop) > 0
+            counts += np.bincount(self._ply_cells(self.records[start:stop], 0)[is_started], minlength=self._CELLS)
+        return counts
+
+    def cell_win_rates(self):
+        """
+        Per cell, the share of the games in which it was filled that its player won (nan for never filled cells)
+        """
+        import numpy as np
+
+        # Games filling each cell, split into those its player lost or tied (even slots) and won (odd slots)
+        counts = np.zeros(2 * self._CELLS, dtype='i8')
+        for start, stop in self._chunks():
+            records = self.records[start:stop]
+            move_counts = self.move_counts(start, stop)
+            outcomes = self.outcomes(start, stop)
+            starting_players = self.starting_players(start, stop)
+            # The starting player fills the even plies
+            is_won = (outcomes == starting_players, outcomes == 1 - starting_players)
+            for ply in range(self._CELLS):
+                is_played = move_counts > ply
+                counts += np.bincount((2 * self._ply_cells(records, ply) + is_won[ply % 2])[is_played], minlength=2 * self._CELLS)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return counts[1::2] / (counts[0::2] + counts[1::2])
+
+
+def main(game_records_path):
+    """
+    Game record statistics
+    """
+    start_time = time.time()
+    records = Game_Records(game_records_path)
+    board_size = records.board_size
+    outcome_counts = records.outcome_counts()
+    opening_frequencies = records.opening_frequencies()
+    cell_win_rates = records.cell_win_rates()
+    elapsed = time.time() - start_time
+
+    games = max(len(records), 1)
+    print('### {0} {1}x{1} K{2} GAMES ###'.format(len(records), board_size, records.win_length))
+    print('Player 1 wins: {0:.1f}%, Player 2 wins: {1:.1f}%, Ties: {2:.1f}%, Unfinished: {3:.1f}%'.format(*(100.0 * outcome_counts / games)))
+    print('Opening frequencies (%):')
+    for row in range(board_size):
+        print(' '.join('{0:6.1f}'.format(100.0 * count / games) for count in opening_frequencies[row * board_size:(row + 1) * board_size]))
+    print('Win rate of the player filling each cell (%):')
+    for row in range(board_size):
+        print(' '.join('{0:6.1f}'.format(100.0 * rate) for rate in cell_win_rates[row * board_size:(row + 1) * board_size]))
+    print('### SCANNING TOOK {0} SECONDS ###'.format(round(elapsed, 2)))
+
+
+def run(game_records_path):
+    """
+    Run the program using the cli inputs
+    """
+    GAME_RECORDS_PATH = game_records_path
+
+    main(GAME_RECORDS_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Record Statistics')
+    parser.add_argument('-i', '--input', dest='input', default=GAME_RECORDS_PATH, help='Game record file written by the trainer or the game')
+    args = parser.parse_args()
+
+    try:
+        run(args.input)
+    except Exception as e:
+        print(e)
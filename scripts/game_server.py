@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import os
+import time
+
+from board import Board, PLAYER_1, PLAYER_2
+from game_ai import Game_AI
+import metrics
+from minimax import Game_Minimax
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Requests are single json lines, longer ones are rejected
+_MAX_LINE_BYTES = 4096
+
+
+class Game_Session():
+
+    def __init__(self, session_id, engine_name, ai_starts=False):
+        """
+        Initialize the state of one game against an engine, the human being PLAYER_1
+        """
+        self.session_id = session_id
+        self.engine_name = engine_name
+        self.board = Board(3)
+        self.turn = PLAYER_2 if ai_starts else PLAYER_1
+        self.winner = None
+
+    def move(self, cell, player):
+        """
+        Play a move of the player whose turn it is
+        """
+        self.board.move(cell, player)
+        self.winner = self.board.winner()
+        self.turn = 1 - player
+
+    def state(self):
+        """
+        Json-ready session state: the players' cell masks, the player to move and the winner (-1 for a tie, None while playing)
+        """
+        return {'session': self.session_id, 'engine': self.engine_name, 'filled': list(self.board.filled), 'turn': self.turn, 'winner': self.winner}
+
+
+class Game_Server():
+
+    def __init__(self, engines):
+        """
+        Initialize the server
+        :param engines: dict mapping engine names to engine instances, each shared by every session
+        """
+        self._engines = dict(engines)
+        # One worker per engine: its searches and caches never run concurrently, and a slow engine only delays its own sessions
+        self._executors = {name: ThreadPoolExecutor(max_workers=1) for name in self._engines}
+        self._sessions = {}
+        self._session_ids = itertools.count(1)
+        self.sessions_handled = 0
+        self.connections = 0
+
+    def close(self):
+        """
+        Stop the engine workers
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _session(self, request, owned_sessions):
+        """
+        Session named by a request, which only the connection that opened it may use
+        """
+        session_id = request.get('session')
+        if session_id not in owned_sessions or session_id not in self._sessions:
+            raise ValueError('unknown session {0}'.format(session_id))
+        return self._sessions[session_id]
+
+    async def _ai_move(self, session):
+        """
+        Let the session's engine play its move on the engine's worker; only the session's own connection can use it
+        and answers its requests one at a time, so nothing else changes the session meanwhile
+        """
+        if session.winner is not None or session.turn != PLAYER_2:
+            raise ValueError('not the ai\'s turn')
+        engine = self._engines[session.engine_name]
+        filled = session.board.filled
+        start_time = time.perf_counter()
+        cell = await asyncio.get_running_loop().run_in_executor(self._executors[session.engine_name], engine.choose_cell, filled[PLAYER_2], filled[PLAYER_1])
+        if metrics.ENABLED:
+            metrics.observe('server.ai_move', time.perf_counter() - start_time)
+        session.move(cell, PLAYER_2)
+        return cell
+
+    async def dispatch(self, request, owned_sessions):
+        """
+        Answer one request
+        :param owned_sessions: ids of the sessions opened by the connection, closed with it
+        """
+        op = request.get('op')
+        if op == 'new':
+            engine_name = request.get('engine', 'minimax')
+            if engine_name not in self._engines:
+                raise ValueError('unknown engine {0}, expected one of {1}'.format(engine_name, sorted(self._engines)))
+            session = Game_Session(next(self._session_ids), engine_name, bool(request.get('ai_starts', False)))
+            self._sessions[session.session_id] = session
+            owned_sessions.add(session.session_id)
+            self.sessions_handled += 1
+            return {'ok': True, 'state': session.state()}
+        elif op == 'move':
+            session = self._session(request, owned_sessions)
+            cell = request.get('cell')
+            if session.winner is not None or session.turn != PLAYER_1:
+                raise ValueError('not the human\'s turn')
+            # Json true and false are ints to python
+            if not isinstance(cell, int) or isinstance(cell, bool) or not 0 <= cell < session.board.cells or not session.board.is_legal(cell):
+                raise ValueError('illegal cell {0}'.format(cell))
+            session.move(cell, PLAYER_1)
+            return {'ok': True, 'state': session.state()}
+        elif op == 'ai_move':
+            session = self._session(request, owned_sessions)
+            cell = await self._ai_move(session)
+            return {'ok': True, 'cell': cell, 'state': session.state()}
+        elif op == 'state':
+            return {'ok': True, 'state': self._session(request, owned_sessions).state()}
+        elif op == 'close':
+            session = self._session(request, owned_sessions)
+            del self._sessions[session.session_id]
+            owned_sessions.discard(session.session_id)
+            return {'ok': True}
+        raise ValueError('unknown op {0}'.format(op))
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the json lines of one client connection until it closes
+        """
+        self.connections += 1
+        owned_sessions = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    break
+                if not line:
+                    break
+                try:
+                    response = await self.dispatch(json.loads(line), owned_sessions)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in owned_sessions:
+                self._sessions.pop(session_id, None)
+            writer.close()
+
+
+async def serve(server, host, port, unix_path):
+    """
+    Serve forever on a tcp port or a unix socket
+    """
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix_path, limit=_MAX_LINE_BYTES)
+        print('### SERVING ON {0} ###'.format(unix_path))
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port, limit=_MAX_LINE_BYTES)
+        print('### SERVING ON {0}:{1} ###'.format(host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(engines, host, port, unix_path):
+    """
+    Headless game server
+    """
+    server = Game_Server(engines)
+    start_time = time.time()
+    try:
+        asyncio.run(serve(server, host, port, unix_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        print('### SERVED {0} SESSIONS OVER {1} CONNECTIONS IN {2} SECONDS ###'.format(server.sessions_handled, server.connections, round(time.time() - start_time, 1)))
+
+
+def run(genes_path, host, port, unix_path, metrics_path):
+    """
+    Run the program using the cli inputs
+    """
+    GENES_PATH = genes_path if genes_path else os.path.join(os.path.dirname(__file__), '../data/best_genes.json')
+    genes_dict = json.load(open(GENES_PATH, 'r'))
+    AI_GENES = (float(genes_dict['aggressive_gene']), float(genes_dict['defensive_gene']), float(genes_dict['random_gene']))
+
+    if metrics_path:
+        metrics.enable(metrics_path)
+
+    engines = {'ai': Game_AI(AI_GENES[0], AI_GENES[1], AI_GENES[2]), 'minimax': Game_Minimax()}
+    main(engines, host, int(port), unix_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Headless Json Lines Server')
+    parser.add_argument('-g', '--genes', dest='genes', default=None, help='Gene file of the evolutionary ai (default: data/best_genes.json)')
+    parser.add_argument('--host', dest='host', default=DEFAULT_HOST, help='Tcp host to listen on')
+    parser.add_argument('--port', dest='port', type=int, default=DEFAULT_PORT, help='Tcp port to listen on')
+    parser.add_argument('-u', '--unix', dest='unix', default=None, help='Listen on this unix socket path instead of tcp')
+    parser.add_argument('--metrics', dest='metrics', default=None, help='Record engine call and ai move latencies, dumped as json to this path at exit')
+    args = parser.parse_args()
+
+    try:
+        run(args.genes, args.host, args.port, args.unix, args.metrics)
+    except Exception as e:
+        print(e)
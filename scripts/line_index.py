@@ -0,0 +1,107 @@
+from board import build_win_masks, mask_cells
+
+
+class _Window_Bucket():
+
+    def __init__(self):
+        """
+        Initialize a set of window indices supporting constant time add, remove and indexing
+        """
+        self._windows = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._windows)
+
+    def __getitem__(self, position):
+        return self._windows[position]
+
+    def __iter__(self):
+        return iter(self._windows)
+
+    def add(self, window):
+        """
+        Add a window
+        """
+        self._positions[window] = len(self._windows)
+        self._windows.append(window)
+
+    def remove(self, window):
+        """
+        Remove a window, moving the last one into its place
+        """
+        position = self._positions.pop(window)
+        last = self._windows.pop()
+        if last != window:
+            self._windows[position] = last
+            self._positions[last] = position
+
+
+class Line_Index():
+
+    def __init__(self, board_size=3, win_length=None):
+        """
+        Initialize the per-line piece counts of two sides (0 for the indexing player, 1 for the opponent) on an empty board,
+        with every line free of one side bucketed by the other side's count, so the fullest open lines are found without scanning the board
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._LINES = build_win_masks(self._BOARD_SIZE, self._WIN_LENGTH)
+        self._LINES_BY_CELL = tuple(tuple(line for line, mask in enumerate(self._LINES) if mask >> cell & 1) for cell in range(self._BOARD_SIZE * self._BOARD_SIZE))
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every move
+        """
+        self.masks = [0, 0]
+        self._counts = [[0] * len(self._LINES), [0] * len(self._LINES)]
+        self._open_lines = [[_Window_Bucket() for _ in range(self._WIN_LENGTH + 1)] for _ in range(2)]
+        for side in range(2):
+            for line in range(len(self._LINES)):
+                self._open_lines[side][0].add(line)
+
+    def add(self, cell, side):
+        """
+        Index a move, updating only the lines through its cell
+        """
+        own_counts = self._counts[side]
+        other_counts = self._counts[1 - side]
+        for line in self._LINES_BY_CELL[cell]:
+            own_count = own_counts[line]
+            other_count = other_counts[line]
+            if other_count == 0:
+                self._open_lines[side][own_count].remove(line)
+                self._open_lines[side][own_count + 1].add(line)
+            # The line is no longer open for the other side
+            if own_count == 0:
+                self._open_lines[1 - side][other_count].remove(line)
+            own_counts[line] = own_count + 1
+        self.masks[side] |= 1 << cell
+
+    def sync(self, self_mask, opponent_mask):
+        """
+        Catch up with a position, indexing only the new moves when it follows the indexed one
+        """
+        if self.masks[0] & ~self_mask or self.masks[1] & ~opponent_mask:
+            self.reset()
+        for cell in mask_cells(self_mask & ~self.masks[0]):
+            self.add(cell, 0)
+        for cell in mask_cells(opponent_mask & ~self.masks[1]):
+            self.add(cell, 1)
+
+    def best_open_lines(self, side):
+        """
+        Lines free of the other side holding the most, but not all, cells of side
+        :return: a bucket of line indices, empty when every line is blocked
+        """
+        for count in range(self._WIN_LENGTH - 1, -1, -1):
+            if len(self._open_lines[side][count]) > 0:
+                return self._open_lines[side][count]
+        return self._open_lines[side][0]
+
+    def empty_cells(self, line):
+        """
+        Empty cells of a line
+        """
+        return mask_cells(self._LINES[line] & ~(self.masks[0] | self.masks[1]))
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+import json
+import os
+
+
+MATCHUP_CACHE_PATH = os.path.join(os.path.dirname(__file__), '../data/matchup_cache.json')
+
+_VERSION = 1
+
+
+class Matchup_Cache():
+
+    def __init__(self, max_entries=100000):
+        """
+        Initialize a bounded, least-recently-used store of gene matchup tallies, accumulated over every epoch played between the same genes
+        """
+        self._MAX_ENTRIES = int(max_entries)
+
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(genes_1, genes_2, board_size, win_length, epoch_size):
+        """
+        Order-free key of a matchup, games alternating the starting player making it symmetric
+        :return: (key, whether genes_2 comes first in the key)
+        """
+        genes_1 = tuple(int(gene) for gene in genes_1)
+        genes_2 = tuple(int(gene) for gene in genes_2)
+        is_swapped = genes_2 < genes_1
+        if is_swapped:
+            genes_1, genes_2 = genes_2, genes_1
+        return (genes_1, genes_2, int(board_size), int(win_length), int(epoch_size)), is_swapped
+
+    def lookup(self, genes_1, genes_2, board_size, win_length, epoch_size):
+        """
+        Find the tallies of a matchup
+        :return: (genes_1 wins, genes_2 wins, ties) or None
+        """
+        key, is_swapped = self._key(genes_1, genes_2, board_size, win_length, epoch_size)
+        tallies = self._entries.get(key)
+        if tallies is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return (tallies[1], tallies[0], tallies[2]) if is_swapped else tuple(tallies)
+
+    def add(self, genes_1, genes_2, board_size, win_length, epoch_size, wins_1, wins_2, ties):
+        """
+        Add the tallies of newly played games to a matchup
+        """
+        key, is_swapped = self._key(genes_1, genes_2, board_size, win_length, epoch_size)
+        if is_swapped:
+            wins_1, wins_2 = wins_2, wins_1
+        tallies = self._entries.get(key, (0, 0, 0))
+        self._entries[key] = (tallies[0] + int(wins_1), tallies[1] + int(wins_2), tallies[2] + int(ties))
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._MAX_ENTRIES:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @classmethod
+    def load(cls, matchup_cache_path=MATCHUP_CACHE_PATH, max_entries=100000):
+        """
+        Cache saved at the given path, least recently used first, or an empty one
+        """
+        cache = cls(max_entries)
+        if os.path.exists(matchup_cache_path):
+            cache_dict = json.load(open(matchup_cache_path, 'r'))
+            if cache_dict.get('version') != _VERSION:
+                raise ValueError('{0} is not a version {1} matchup cache'.format(matchup_cache_path, _VERSION))
+            for genes_1, genes_2, board_size, win_length, epoch_size, tallies in cache_dict['entries']:
+                cache.add(genes_1, genes_2, board_size, win_length, epoch_size, *tallies)
+        return cache
+
+    def save(self, matchup_cache_path=MATCHUP_CACHE_PATH):
+        """
+        Atomically replace the saved cache, keeping the recency order
+        """
+        entries = [[list(key[0]), list(key[1]), key[2], key[3], key[4], list(tallies)] for key, tallies in self._entries.items()]
+        temporary_path = matchup_cache_path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({'version': _VERSION, 'entries': entries}, cache_file)
+            cache_file.flush()
+            os.fsync(cache_file.fileno())
+        os.replace(temporary_path, matchup_cache_path)
@@ -0,0 +1,280 @@
+import math
+import multiprocessing
+import time
+
+from board import Board, lists_to_mask, popcount
+import metrics
+from random_stream import as_stream
+
+
+# Playouts between two checks of the move deadline
+_DEADLINE_CHECK_PLAYOUTS = 16
+
+# Seconds between two checks of the cancel event while root-parallel workers search
+_CANCEL_POLL_SECONDS = 0.01
+
+# Stop event shared by the engine with its worker processes, set when the running search is cancelled
+_worker_stop_event = None
+
+
+class _Node():
+
+    __slots__ = ('cell', 'player', 'parent', 'children', 'untried', 'visits', 'wins', 'winner')
+
+    def __init__(self, cell, player, parent, untried, winner=None):
+        """
+        Initialize a search tree node reached by the player filling the cell (-1 and the opponent of the side to move at the root)
+        :param untried: cells not expanded yet
+        :param winner: the player who won with this move, -1 for a full board, None while the game goes on
+        """
+        self.cell = cell
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        # Playout wins of the player who moved into the node, ties counted as half a win
+        self.wins = 0.0
+        self.winner = winner
+
+
+def _init_worker(stop_event):
+    """
+    Keep the engine's stop event in a worker process
+    """
+    global _worker_stop_event
+    _worker_stop_event = stop_event
+
+
+def _search_root(task):
+    """
+    Search one root-parallel tree from scratch in a worker process
+    :return: a dict mapping each root move to its visit count
+    """
+    board_size, win_length, self_mask, opponent_mask, playouts, time_budget, exploration, rng = task
+    engine = Game_MCTS(board_size, win_length, playouts, time_budget, exploration, rng=rng)
+    root = _Node(-1, 1, None, engine._new_board(self_mask, opponent_mask).empty_cells())
+    engine._search(root, self_mask, opponent_mask, _worker_stop_event)
+    return {child.cell: child.visits for child in root.children}
+
+
+class Game_MCTS():
+
+    def __init__(self, board_size=3, win_length=None, playouts=None, time_budget=1.0, exploration=math.sqrt(2), workers=1, rng=None):
+        """
+        Initialize Monte Carlo tree search with random playouts
+        :param playouts: playouts per move, None to search for time_budget seconds instead
+        :param exploration: UCT exploration constant
+        :param workers: processes searching independent trees from the root, their visit counts summed
+        :param rng: Random_Stream of the playouts, or its seed (None, an int or a SeedSequence)
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._PLAYOUTS = None if playouts is None else int(playouts)
+        self._TIME_BUDGET = float(time_budget)
+        self._EXPLORATION = float(exploration)
+        self._WORKERS = max(int(workers), 1)
+        self._rng = as_stream(rng)
+        self._pool = None
+        self._stop_event = None
+
+        # Tree of the last search and its root position, reused when the next position follows from it
+        self._root = None
+        self._root_masks = None
+
+        # Playouts run by the last search and those inherited from the previous tree
+        self.playouts = 0
+        self.reused_playouts = 0
+
+    def _new_board(self, self_mask=0, opponent_mask=0):
+        """
+        Board of the engine's configuration, the side to move at index 0
+        """
+        return Board(self._BOARD_SIZE, self._WIN_LENGTH, (self_mask, opponent_mask))
+
+    def _playout(self, board, player):
+        """
+        Play uniformly random moves to the end of the game, drawing the move order one cell at a time so a win stops it early
+        :return: the winning player, -1 for a tie
+        """
+        cells = board.empty_cells()
+        index = self._rng.index
+        for remaining in range(len(cells), 0, -1):
+            position = index(remaining)
+            cell = cells[position]
+            cells[position] = cells[remaining - 1]
+            if board.wins_with(cell, player):
+                return player
+            board.move(cell, player)
+            player = 1 - player
+        return -1
+
+    def _select(self, node):
+        """
+        Child with the best UCT score
+        """
+        scale = self._EXPLORATION * math.sqrt(math.log(node.visits))
+        best_child = None
+        best_score = -1.0
+        for child in node.children:
+            score = child.wins / child.visits + scale / math.sqrt(child.visits)
+            if score > best_score:
+                best_score = score
+                best_child = child
+        return best_child
+
+    def _search(self, root, self_mask, opponent_mask, cancel_event=None):
+        """
+        Grow the tree of the position until the playout or time budget runs out, or the cancel event is set
+        """
+        board = self._new_board(self_mask, opponent_mask)
+        filled = board.filled
+        deadline = None if self._PLAYOUTS is not None else time.perf_counter() + self._TIME_BUDGET
+        playouts = 0
+        while True:
+            if self._PLAYOUTS is not None and playouts >= self._PLAYOUTS:
+                break
+            if playouts % _DEADLINE_CHECK_PLAYOUTS == 0 and ((cancel_event is not None and cancel_event.is_set()) or (deadline is not None and time.perf_counter() > deadline)):
+                break
+            filled[0] = self_mask
+            filled[1] = opponent_mask
+
+            # Selection
+            node = root
+            while node.winner is None and not node.untried and node.children:
+                node = self._select(node)
+                board.move(node.cell, node.player)
+
+            # Expansion
+            if node.winner is None and node.untried:
+                position = self._rng.index(len(node.untried))
+                cell = node.untried[position]
+                node.untried[position] = node.untried[-1]
+                node.untried.pop()
+                player = 1 - node.player
+                winner = player if board.wins_with(cell, player) else None
+                board.move(cell, player)
+                if winner is None and board.is_full():
+                    winner = -1
+                child = _Node(cell, player, node, [] if winner is not None else board.empty_cells(), winner)
+                node.children.append(child)
+                node = child
+
+            # Simulation
+            winner = node.winner if node.winner is not None else self._playout(board, 1 - node.player)
+
+            # Backpropagation
+            while node is not None:
+                node.visits += 1
+                if winner == node.player:
+                    node.wins += 1.0
+                elif winner == -1:
+                    node.wins += 0.5
+                node = node.parent
+            playouts += 1
+        self.playouts = playouts
+
+    def _reused_root(self, self_mask, opponent_mask):
+        """
+        Subtree of the last search for the position, when it is the same one or follows it by one move of each side
+        """
+        if self._root is None:
+            return None
+        root_self, root_opponent = self._root_masks
+        if (root_self, root_opponent) == (self_mask, opponent_mask):
+            return self._root
+        added_self = self_mask & ~root_self
+        added_opponent = opponent_mask & ~root_opponent
+        if root_self & ~self_mask or root_opponent & ~opponent_mask or popcount(added_self) != 1 or popcount(added_opponent) != 1:
+            return None
+        for child in self._root.children:
+            if 1 << child.cell == added_self:
+                for grandchild in child.children:
+                    if 1 << grandchild.cell == added_opponent:
+                        # The opponent moved into it, as at a fresh root
+                        grandchild.parent = None
+                        return grandchild
+        return None
+
+    def _parallel_visits(self, self_mask, opponent_mask, cancel_event=None):
+        """
+        Root-parallel search: independent trees in worker processes, their root visit counts summed;
+        setting the cancel event stops every worker through the stop event they share with the engine
+        """
+        if self._pool is None:
+            self._stop_event = multiprocessing.Event()
+            self._pool = multiprocessing.Pool(self._WORKERS, initializer=_init_worker, initargs=(self._stop_event,))
+        playouts = None if self._PLAYOUTS is None else -(-self._PLAYOUTS // self._WORKERS)
+        tasks = [(self._BOARD_SIZE, self._WIN_LENGTH, self_mask, opponent_mask, playouts, self._TIME_BUDGET, self._EXPLORATION, stream) for stream in self._rng.spawn(self._WORKERS)]
+        self._stop_event.clear()
+        pending = self._pool.map_async(_search_root, tasks)
+        while not pending.ready():
+            pending.wait(_CANCEL_POLL_SECONDS)
+            if cancel_event is not None and cancel_event.is_set():
+                self._stop_event.set()
+        visits = {}
+        for worker_visits in pending.get():
+            for cell, cell_visits in worker_visits.items():
+                visits[cell] = visits.get(cell, 0) + cell_visits
+        self.playouts = sum(visits.values())
+        self.reused_playouts = 0
+        return visits
+
+    def choose_cell(self, self_mask, opponent_mask, log_choice=False, cancel_event=None):
+        """
+        Choose the next fill cell index on the bitboard representation: the most visited root move
+        :param cancel_event: threading.Event of this move only, set (e.g. from another thread) to stop its search at the most visited move so far
+        """
+        self.playouts = 0
+        self.reused_playouts = 0
+        board = self._new_board(self_mask, opponent_mask)
+        empty_cells = board.empty_cells()
+
+        # Filled Board
+        if len(empty_cells) == 0 or board.winner() is not None:
+            return
+        # A winning move needs no search
+        for cell in empty_cells:
+            if board.wins_with(cell, 0):
+                return cell
+
+        if self._WORKERS > 1:
+            visits = self._parallel_visits(self_mask, opponent_mask, cancel_event)
+        else:
+            root = self._reused_root(self_mask, opponent_mask)
+            if root is None:
+                root = _Node(-1, 1, None, empty_cells)
+            self.reused_playouts = root.visits
+            self._search(root, self_mask, opponent_mask, cancel_event)
+            self._root = root
+            self._root_masks = (self_mask, opponent_mask)
+            visits = {child.cell: child.visits for child in root.children}
+
+        if len(visits) == 0:
+            return empty_cells[self._rng.index(len(empty_cells))]
+        cell = max(visits, key=visits.get)
+        if log_choice:
+            print('MCTS Choice: {0} of {1} playouts ({2} reused)'.format(visits[cell], self.playouts + self.reused_playouts, self.reused_playouts))
+        return cell
+
+    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+        """
+        Choose the next fill position
+        """
+        cell = self.choose_cell(lists_to_mask(self_filled), lists_to_mask(opponent_filled), log_choice)
+        if cell is None:
+            return
+        return [cell // self._BOARD_SIZE, cell % self._BOARD_SIZE]
+
+    def close(self):
+        """
+        Stop the root-parallel worker processes
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._stop_event = None
+
+
+metrics.register(Game_MCTS, 'choose_cell', 'mcts.choose_cell', {'mcts.playouts': lambda engine: engine.playouts})
@@ -0,0 +1,155 @@
+import atexit
+import functools
+import json
+import time
+
+
+# Histogram bucket i counts samples below 2 ** i microseconds
+_BUCKETS = 40
+
+# Checked by callers before timing anything, so disabled metrics cost one attribute lookup
+ENABLED = False
+
+_counters = {}
+_histograms = {}
+_instrumented = []
+_registered = []
+
+
+class _Histogram():
+
+    def __init__(self):
+        """
+        Initialize a log2-bucketed latency histogram of bounded size
+        """
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = 0.0
+        self.last = 0.0
+        self.buckets = [0] * _BUCKETS
+
+    def observe(self, seconds):
+        """
+        Record a sample
+        """
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), _BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """
+        Upper bucket bound, in seconds, below which the given fraction of samples fall
+        """
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= threshold and bucket_count > 0:
+                return min((2 ** bucket) / 1e6, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        """
+        Json-ready summary, times in milliseconds
+        """
+        if self.count == 0:
+            return {'count': 0}
+        return {'count': self.count, 'mean_ms': 1000.0 * self.total / self.count, 'min_ms': 1000.0 * self.minimum, 'max_ms': 1000.0 * self.maximum,
+                'p50_ms': 1000.0 * self.percentile(0.5), 'p95_ms': 1000.0 * self.percentile(0.95), 'p99_ms': 1000.0 * self.percentile(0.99)}
+
+
+def count(name, value=1):
+    """
+    Add to a counter
+    """
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """
+    Record a latency sample
+    """
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = _Histogram()
+    histogram.observe(seconds)
+
+
+def histogram(name):
+    """
+    Histogram of the given name, or None if nothing was recorded
+    """
+    return _histograms.get(name)
+
+
+def register(cls, method_name, histogram_name, counters=None):
+    """
+    Register a method to be wrapped with a latency histogram (and optional counters read from the instance after each call) once metrics are enabled
+    :param counters: dict mapping counter names to functions of the instance
+    """
+    _registered.append((cls, method_name, histogram_name, counters or {}))
+    if ENABLED:
+        _instrument(cls, method_name, histogram_name, counters or {})
+
+
+def _instrument(cls, method_name, histogram_name, counters):
+    """
+    Replace a method with a timed wrapper
+    """
+    method = getattr(cls, method_name)
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        observe(histogram_name, time.perf_counter() - start_time)
+        for counter_name, read_counter in counters.items():
+            count(counter_name, read_counter(self))
+        return result
+
+    setattr(cls, method_name, timed)
+    _instrumented.append((cls, method_name, method))
+
+
+def enable(metrics_path=None):
+    """
+    Turn metrics on, instrument the registered methods and dump the metrics as json to metrics_path at exit
+    """
+    global ENABLED
+    if not ENABLED:
+        ENABLED = True
+        for cls, method_name, histogram_name, counters in _registered:
+            _instrument(cls, method_name, histogram_name, counters)
+    if metrics_path:
+        atexit.register(dump, metrics_path)
+
+
+def disable():
+    """
+    Turn metrics off and restore the instrumented methods
+    """
+    global ENABLED
+    ENABLED = False
+    while _instrumented:
+        cls, method_name, method = _instrumented.pop()
+        setattr(cls, method_name, method)
+
+
+def snapshot():
+    """
+    Json-ready copy of every counter and histogram summary
+    """
+    return {'counters': dict(_counters), 'histograms': {name: histogram.summary() for name, histogram in _histograms.items()}}
+
+
+def dump(metrics_path):
+    """
+    Save the snapshot as json
+    """
+    json.dump(snapshot(), open(metrics_path, 'w'), indent=2, sort_keys=True)
@@ -1,109 +1,157 @@
 from math import inf as infinity
-from random import choice
+import time
+
+from board import Board, lists_to_mask, popcount
+import metrics
+from move_book import MOVE_BOOK_PATH, Move_Book
+from outcome_table import OUTCOME_TABLE_PATH, Outcome_Table
+from transposition import Transposition_Table
+
+# Transposition tables shared by every Game_Minimax of the same board configuration, so searches are reused across moves and games
+_SHARED_TABLES = {}
+
+# Alpha-beta transposition table entry bounds
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Nodes searched between two checks of the move deadline
+_DEADLINE_CHECK_NODES = 1024
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the move time budget runs out
+    """
+
 
 class Game_Minimax():
 
-    def __init__(self, board_size=3):
+    def __init__(self, board_size=3, win_length=None, time_budget=1.0, transposition_table=None, max_table_entries=100000, move_book_path=MOVE_BOOK_PATH, rng=None, outcome_table_path=OUTCOME_TABLE_PATH):
         """
         Initialize MiniMax
+        :param rng: Random_Stream of the empty board choices, or its seed (None, an int or a SeedSequence)
         """
         self._MINIMAX = 1
         self._OTHER_PLAYER = -1
+        self._BOARD_SIZE = int(board_size)
+        self._WIN_LENGTH = self._BOARD_SIZE if win_length is None else int(win_length)
+        self._TIME_BUDGET = None if time_budget is None else float(time_budget)
+
+        config = (self._BOARD_SIZE, self._WIN_LENGTH)
+        if transposition_table is None:
+            if config not in _SHARED_TABLES:
+                _SHARED_TABLES[config] = (Transposition_Table(self._BOARD_SIZE, max_table_entries), Transposition_Table(self._BOARD_SIZE, max_table_entries))
+            self._table, self._bound_table = _SHARED_TABLES[config]
+        else:
+            self._table = transposition_table
+            self._bound_table = Transposition_Table(self._BOARD_SIZE, max_table_entries)
+
+        # Center first, then corners, then edges: cells crossed by more winning lines come first
+        layout = self._new_board()
+        self._CELL_ORDER = tuple(sorted(range(layout.cells), key=lambda cell: -len(layout.win_masks_by_cell[cell])))
+
+        # Horizon evaluation weights by pieces on an open line, scaled so any evaluation stays inside (-1, 1) below a win
+        self._LINE_WEIGHTS = tuple(4 ** count - 1 for count in range(self._WIN_LENGTH + 1))
+        self._EVALUATION_SCALE = float(len(layout.win_masks) * self._LINE_WEIGHTS[self._WIN_LENGTH - 1] + 1)
 
-    def empty_cells(self, self_filled, opponent_filled):
+        # Perfect-play book of solved positions, searched positions are used when it is missing
+        self._move_book = Move_Book.open(move_book_path) if move_book_path else None
+        if self._move_book is not None and (self._move_book.board_size, self._move_book.win_length) != config:
+            self._move_book = None
+
+        # Retrograde outcome table of every position (solved for 4x4), consulted when there is no book
+        self._outcome_table = Outcome_Table.open(outcome_table_path) if outcome_table_path else None
+        if self._outcome_table is not None and (self._outcome_table.board_size, self._outcome_table.win_length) != config:
+            self._outcome_table = None
+
+        # Nodes visited and depth reached by the last search
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = infinity
+        # Cancel token of the running search, set from another thread to stop it
+        self._cancel_event = None
+
+        # Random stream, created on the first empty board so searching alone never loads numpy
+        self._rng_seed = rng
+        self._rng = None
+
+        # Index of each player's mask in Board.filled
+        self._FILLED_INDEX = {self._MINIMAX: 0, self._OTHER_PLAYER: 1}
+
+    def empty_cells(self, board):
         """
         Each empty cell will be added into cells' list
-        :param self_filled: the state of the self_filled in current board
-        :param opponent_filled: the state of the opponent_filled in current board
-        :return: a list of empty cells
+        :param board: the bitboard of the current state, minimax cells first
+        :return: a list of empty cell indices in row-major order
         """
-        cells = []
+        return board.empty_cells()
 
-        for x in range(3):
-            for y in range(3):
-                if self_filled[x][y] == 0 and opponent_filled[x][y] == 0:
-                    cells.append([x, y])
-
-        return cells
-
-    def wins(self, state, player):
+    def wins(self, board, player):
         """
-        This function tests if a specific player wins. Possibilities:
-        * Three rows    [X X X] or [O O O]
-        * Three cols    [X X X] or [O O O]
-        * Two diagonals [X X X] or [O O O]
-        :param state: the state of the current board
+        This function tests if a specific player wins, looking up the
+        player's mask against the precomputed win masks (rows, cols and diagonals)
+        :param board: the bitboard of the current state
         :param player: a human or a computer
         :return: True if the player wins
         """
-        win_state = [
-            [state[0][0], state[0][1], state[0][2]],
-            [state[1][0], state[1][1], state[1][2]],
-            [state[2][0], state[2][1], state[2][2]],
-            [state[0][0], state[1][0], state[2][0]],
-            [state[0][1], state[1][1], state[2][1]],
-            [state[0][2], state[1][2], state[2][2]],
-            [state[0][0], state[1][1], state[2][2]],
-            [state[2][0], state[1][1], state[0][2]],
-        ]
-        if [1, 1, 1] in win_state:
-            return True
-        else:
-            return False
+        return board.has_won(self._FILLED_INDEX[player])
 
-    def evaluate(self, self_filled, opponent_filled):
+    def evaluate(self, board):
         """
         Function to heuristic evaluation of state.
-        :param state: the state of the current board
+        :param board: the bitboard of the current state
         :return: +1 if the computer wins; -1 if the human wins; 0 draw
         """
-        if self.wins(self_filled, self._MINIMAX):
+        if self.wins(board, self._MINIMAX):
             score = +1
-        elif self.wins(opponent_filled, self._OTHER_PLAYER):
+        elif self.wins(board, self._OTHER_PLAYER):
             score = -1
         else:
             score = 0
 
         return score
 
-    def game_over(self, self_filled, opponent_filled):
+    def game_over(self, board):
         """
         This function test if the human or computer wins
-        :param state: the state of the current board
+        :param board: the bitboard of the current state
         :return: True if the human or computer wins
         """
-        return self.wins(opponent_filled, self._OTHER_PLAYER) or self.wins(self_filled, self._MINIMAX)
+        return self.wins(board, self._OTHER_PLAYER) or self.wins(board, self._MINIMAX)
 
-    def minimax(self, self_filled, opponent_filled, depth, player, log_choice=False):
+    def minimax(self, board, depth, player, log_choice=False):
         """
         AI function that choice the best move
-        :param state: current state of the board
+        :param board: the bitboard of the current state, updated in place and restored
         :param depth: node index in the tree (0 <= depth <= 9),
         but never nine in this case (see iaturn() function)
         :param player: an human or a computer
         :return: a list with [the best row, best col, best score]
         """
+        self.nodes += 1
         if player == self._MINIMAX:
             best = [-1, -1, -infinity]
         else:
             best = [-1, -1, +infinity]
 
-        if depth == 0 or self.game_over(self_filled, opponent_filled):
-            score = self.evaluate(self_filled ,opponent_filled)
+        if depth == 0 or self.game_over(board):
+            score = self.evaluate(board)
             return [-1, -1, score]
 
-        for cell in self.empty_cells(self_filled, opponent_filled):
-            x, y = cell[0], cell[1]
-            if player == self._MINIMAX:
-                self_filled[x][y] = 1
-            else:
-                opponent_filled[x][y] = 1
-            score = self.minimax(self_filled, opponent_filled, depth - 1, -player)
-            if player == self._MINIMAX:
-                self_filled[x][y] = 0
-            else:
-                opponent_filled[x][y] = 0
-            score[0], score[1] = x, y
+        # Only full-depth results are exact, so only those are cached
+        is_exact = depth == popcount(board.empty())
+        if is_exact:
+            cached = self._lookup(board, player)
+            if cached is not None:
+                return cached
+
+        filled_index = self._FILLED_INDEX[player]
+        for cell in self.empty_cells(board):
+            board.move(cell, filled_index)
+            score = self.minimax(board, depth - 1, -player)
+            board.undo(cell, filled_index)
+            score[0], score[1] = board.position(cell)
 
             if player == self._MINIMAX:
                 if score[2] > best[2]:
@@ -112,27 +160,289 @@ class Game_Minimax():
                 if score[2] < best[2]:
                     best = score  # min value
 
+        if is_exact:
+            self._store(board, player, best)
         return best
 
-    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+    def _lookup(self, board, player):
         """
-        Choose the next fill position
+        Look the position up in the transposition table
+        :return: a list with [the best row, best col, best score] or None
+        """
+        if player == self._MINIMAX:
+            entry = self._table.lookup(board.filled[0], board.filled[1])
+        else:
+            entry = self._table.lookup(board.filled[1], board.filled[0])
+        if entry is None:
+            return None
+        # Entries are scored for the side to move
+        score = entry[0] if player == self._MINIMAX else -entry[0]
+        return board.position(entry[1]) + [score]
+
+    def _store(self, board, player, best):
+        """
+        Store a searched position in the transposition table
         """
-        is_board_empty = True
-        is_board_full = True
-        possible_positions = self.empty_cells(self_filled, opponent_filled)
-        depth = len(possible_positions)
+        cell = board.cell(best[0], best[1])
+        if player == self._MINIMAX:
+            self._table.store(board.filled[0], board.filled[1], best[2], cell)
+        else:
+            self._table.store(board.filled[1], board.filled[0], -best[2], cell)
+
+    def _ordered_cells(self, board, mover, empty_mask, hint_cell=-1):
+        """
+        Empty cells in search order: wins, then blocks, then the hinted cell, then center, corners and edges
+        :param board: the bitboard of the current state
+        :param mover: index in Board.filled of the player to move
+        :param empty_mask: mask of the empty cells
+        :param hint_cell: best cell of a previous search of this position, or -1
+        :return: a list of cell indices
+        """
+        wins = []
+        blocks = []
+        rest = []
+        for cell in self._CELL_ORDER:
+            if not empty_mask >> cell & 1:
+                continue
+            if board.wins_with(cell, mover):
+                wins.append(cell)
+            elif board.wins_with(cell, 1 - mover):
+                blocks.append(cell)
+            elif cell == hint_cell:
+                rest.insert(0, cell)
+            else:
+                rest.append(cell)
+        return wins + blocks + rest
+
+    def _new_board(self, self_mask=0, opponent_mask=0):
+        """
+        Bitboard of the engine's board configuration
+        """
+        return Board(self._BOARD_SIZE, self._WIN_LENGTH, (self_mask, opponent_mask))
+
+    def heuristic(self, board, mover):
+        """
+        Horizon evaluation of a position without a winner
+        :param board: the bitboard of the current state
+        :param mover: index in Board.filled of the player to move
+        :return: a score in (-1, 1) weighing the lines still open to each player
+        """
+        own = board.filled[mover]
+        other = board.filled[1 - mover]
+        score = 0
+        for line in board.win_masks:
+            if not other & line:
+                score += self._LINE_WEIGHTS[popcount(own & line)]
+            elif not own & line:
+                score -= self._LINE_WEIGHTS[popcount(other & line)]
+        return score / self._EVALUATION_SCALE
+
+    def alphabeta(self, board, mover, alpha=-infinity, beta=+infinity, depth=None):
+        """
+        Negamax alpha-beta search with move ordering and depth-adjusted scores
+        :param board: the bitboard of the current state, updated in place and restored
+        :param mover: index in Board.filled of the player to move
+        :param alpha: lower bound of the search window
+        :param beta: upper bound of the search window
+        :param depth: plies to search before evaluating the horizon, None to search to the end
+        :return: a tuple with (the best score for the mover, best cell); a win
+        scores 1 + the cells left empty, so faster wins and slower losses score higher
+        """
+        self.nodes += 1
+        if self.nodes % _DEADLINE_CHECK_NODES == 0 and (time.perf_counter() > self._deadline or (self._cancel_event is not None and self._cancel_event.is_set())):
+            raise SearchTimeout()
+        other = 1 - mover
+        empty_mask = board.empty()
+        empties = popcount(empty_mask)
+
+        if board.has_won(other):
+            return -(empties + 1), -1
+        if empty_mask == 0:
+            return 0, -1
+        # Searching as deep as the empty cells is searching to the end
+        if depth is None or depth > empties:
+            depth = empties
+        if depth == 0:
+            return self.heuristic(board, mover), -1
+
+        alpha_original = alpha
+        hint_cell = -1
+        entry = self._bound_table.lookup(board.filled[mover], board.filled[other])
+        if entry is not None:
+            score, cell, bound, entry_depth = entry
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return score, cell
+                elif bound == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score, cell
+            hint_cell = cell
+
+        best_score = -infinity
+        best_cell = -1
+        bound = None
+        for cell in self._ordered_cells(board, mover, empty_mask, hint_cell):
+            if board.wins_with(cell, mover):
+                # Nothing scores higher than winning right now
+                best_score, best_cell, bound, depth = empties, cell, EXACT, empties
+                break
+            board.move(cell, mover)
+            score = -self.alphabeta(board, other, -beta, -alpha, depth - 1)[0]
+            board.undo(cell, mover)
+            if score > best_score:
+                best_score, best_cell = score, cell
+            if best_score > alpha:
+                alpha = best_score
+            if alpha >= beta:
+                break
+
+        if bound is None:
+            if best_score <= alpha_original:
+                bound = UPPER_BOUND
+            elif best_score >= beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+        self._bound_table.store(board.filled[mover], board.filled[other], best_score, best_cell, bound, depth)
+        return best_score, best_cell
+
+    def iterative_deepening(self, board, mover, time_budget=None, cancel_event=None):
+        """
+        Search one ply deeper at a time until the end of the game, the time budget or the cancellation
+        :param board: the bitboard of the current state
+        :param mover: index in Board.filled of the player to move
+        :param time_budget: seconds to search, None for no limit
+        :param cancel_event: threading.Event of this search only, set (e.g. from another thread) to stop it
+        :return: a tuple with (the best score, best cell) of the deepest completed search
+        """
+        empties = popcount(board.empty())
+        self._deadline = infinity if time_budget is None else time.perf_counter() + time_budget
+        self._cancel_event = cancel_event
+        self.depth_reached = 0
+        best = (0, self._ordered_cells(board, mover, board.empty())[0])
+        try:
+            for depth in range(1, empties + 1):
+                best = self.alphabeta(board.copy(), mover, depth=depth)
+                self.depth_reached = depth
+                # A proven win or loss does not change with more depth
+                if abs(best[0]) >= 1:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self._cancel_event = None
+            self._deadline = infinity
+        return best
+
+    def best_moves(self, self_mask, opponent_mask):
+        """
+        Every cell reaching the game-theoretic value of the position, the set plain minimax chooses from
+        :param self_mask: the minimax player's cells
+        :param opponent_mask: the other player's cells
+        :return: a sorted list of cell indices
+        """
+        board = self._new_board(self_mask, opponent_mask)
+        if self.game_over(board) or board.is_full():
+            return []
+        best_score = self.alphabeta(board, 0)[0]
+        if best_score < 0:
+            return board.empty_cells()
+
+        # Null-window test of each move against the best value (win: score >= 1, draw: score >= 0)
+        low, high = (0, 1) if best_score > 0 else (-1, 0)
+        moves = []
+        for cell in board.empty_cells():
+            board.move(cell, 0)
+            score = -self.alphabeta(board, 1, -high, -low)[0]
+            board.undo(cell, 0)
+            if score >= high:
+                moves.append(cell)
+        return moves
+
+    def choose_cell(self, self_mask, opponent_mask, log_choice=False, cancel_event=None):
+        """
+        Choose the next fill cell index on the bitboard representation
+        :param cancel_event: threading.Event of this move only, set to stop its search at the deepest completed result
+        """
+        self.nodes = 0
+        board = self._new_board(self_mask, opponent_mask)
+        depth = len(self.empty_cells(board))
 
         # Empty Board
-        if depth == 9:
-            x = choice([0, 1, 2])
-            y = choice([0, 1, 2])
-            return [x, y]
+        if depth == board.cells:
+            return self._random_stream().index(board.cells)
         # Filled Board
-        elif depth == 0 or self.game_over(self_filled, opponent_filled):
+        elif depth == 0 or self.game_over(board):
             return
         # Normal Board
         else:
-            move = self.minimax(self_filled, opponent_filled, depth, self._MINIMAX)
-            x, y = move[0], move[1]
-            return [x, y]
\ No newline at end of file
+            if self._move_book is not None:
+                entry = self._move_book.lookup(self_mask, opponent_mask)
+                if entry is not None:
+                    return entry[1][0]
+            if self._outcome_table is not None:
+                cells = self._outcome_table.best_cells(self_mask, opponent_mask)
+                if len(cells) > 0:
+                    return cells[0]
+            return self.iterative_deepening(board, 0, self._TIME_BUDGET, cancel_event)[1]
+
+    def _random_stream(self):
+        """
+        The engine's random stream
+        """
+        if self._rng is None:
+            from random_stream import as_stream
+            self._rng = as_stream(self._rng_seed)
+        return self._rng
+
+    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+        """
+        Choose the next fill position
+        """
+        cell = self.choose_cell(lists_to_mask(self_filled), lists_to_mask(opponent_filled), log_choice)
+        if cell is None:
+            return
+        return [cell // self._BOARD_SIZE, cell % self._BOARD_SIZE]
+
+    def choose_positions(self, boards, rng=None):
+        """
+        Choose the next fill position of many boards at once, from vectorized move book lookups where possible
+        :param boards: an (N, cells) or (N, n, n) array, positive for the minimax's cells, negative for the opponent's and 0 for empty cells
+        :param rng: numpy Generator of the empty board choices, the engine's own stream by default
+        :return: an (N, 2) array of (row, col) positions, (-1, -1) for finished boards
+        """
+        # Only batch callers pay for the numpy import
+        import numpy as np
+        from batch_simulator import cells_to_masks, split_boards
+
+        rng = self._random_stream().generator if rng is None else rng
+        own, other = split_boards(boards, self._BOARD_SIZE)
+        layout = self._new_board()
+        lines = np.array([[(line >> cell) & 1 for cell in range(layout.cells)] for line in layout.win_masks], dtype=np.int32)
+
+        cells = np.full(len(own), -1, dtype=np.int64)
+        is_over = (own + other).all(axis=1) | ((own @ lines.T) == self._WIN_LENGTH).any(axis=1) | ((other @ lines.T) == self._WIN_LENGTH).any(axis=1)
+        is_empty = ~(own + other).any(axis=1)
+        cells[is_empty] = rng.integers(0, layout.cells, int(is_empty.sum()))
+
+        pending = np.flatnonzero(~is_over & ~is_empty)
+        own_masks = cells_to_masks(own[pending])
+        other_masks = cells_to_masks(other[pending])
+        if self._move_book is not None and len(pending) > 0:
+            found, _, book_cells = self._move_book.lookup_batch(own_masks, other_masks)
+            cells[pending[found]] = book_cells[found]
+            pending, own_masks, other_masks = pending[~found], own_masks[~found], other_masks[~found]
+
+        # Positions missing from the book are searched one by one
+        for index, own_mask, other_mask in zip(pending, own_masks, other_masks):
+            cells[index] = self.choose_cell(int(own_mask), int(other_mask))
+
+        positions = np.stack([cells // self._BOARD_SIZE, cells % self._BOARD_SIZE], axis=1)
+        positions[cells < 0] = -1
+        return positions
+
+
+metrics.register(Game_Minimax, 'choose_cell', 'minimax.choose_cell', {'minimax.nodes': lambda engine: engine.nodes})
@@ -0,0 +1,202 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+
+from board import Board, canonical_position, mask_cells, popcount, symmetry_permutations, unmap_cell
+
+
+MOVE_BOOK_PATH = os.path.join(os.path.dirname(__file__), '../data/move_book.bin')
+
+# Header: magic, version, board size, win length, record count
+_HEADER = struct.Struct('<4sBBBxI')
+# Record: canonical position key, best cells mask, depth-adjusted score of the side to move
+_RECORD = struct.Struct('<IHbx')
+_MAGIC = b'TTTB'
+_VERSION = 2
+
+# Opened books shared by every engine of the process
+_OPEN_BOOKS = {}
+
+
+def _solve_positions(board_size, win_length=None):
+    """
+    Solve every reachable position by retrograde analysis, layer by layer from the full board back to the empty one
+    :return: a dict mapping each canonical non-terminal position key to (score, best cells mask)
+    """
+    board = Board(board_size, win_length)
+    cells = board.cells
+
+    # Forward pass: enumerate the canonical positions of each piece count, the side to move always first in the key.
+    # Winning moves end the game, so they are scored inline instead of being enumerated
+    layers = [set() for _ in range(cells + 1)]
+    layers[0].add(0)
+    for pieces in range(cells):
+        for key in layers[pieces]:
+            mover, other = key >> cells, key & board.full_mask
+            board.filled = [mover, other]
+            for cell in mask_cells(board.empty()):
+                if board.wins_with(cell, 0):
+                    continue
+                layers[pieces + 1].add(canonical_position(other, mover | (1 << cell), board_size)[0])
+
+    # Backward pass: every child of a layer is solved before the layer itself
+    scores = {}
+    book = {}
+    for pieces in range(cells, -1, -1):
+        for key in layers[pieces]:
+            mover, other = key >> cells, key & board.full_mask
+            empties = cells - pieces
+            if empties == 0:
+                scores[key] = 0
+                continue
+            board.filled = [mover, other]
+            best_score = None
+            best_cells = 0
+            for cell in mask_cells(board.empty()):
+                if board.wins_with(cell, 0):
+                    score = empties
+                else:
+                    score = -scores[canonical_position(other, mover | (1 << cell), board_size)[0]]
+                if best_score is None or score > best_score:
+                    best_score = score
+                    best_cells = 1 << cell
+                elif score == best_score:
+                    best_cells |= 1 << cell
+            scores[key] = best_score
+            book[key] = (best_score, best_cells)
+    return book
+
+
+def write_move_book(book, board_size, win_length, move_book_path):
+    """
+    Write the solved positions as a sorted binary table
+    """
+    with open(move_book_path, 'wb') as book_file:
+        book_file.write(_HEADER.pack(_MAGIC, _VERSION, board_size, win_length, len(book)))
+        for key in sorted(book):
+            score, best_cells = book[key]
+            book_file.write(_RECORD.pack(key, best_cells, score))
+
+
+class Move_Book():
+
+    def __init__(self, move_book_path):
+        """
+        Memory-map a move book written by write_move_book
+        """
+        with open(move_book_path, 'rb') as book_file:
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, win_length, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('{0} is not a version {1} move book'.format(move_book_path, _VERSION))
+        self.board_size = board_size
+        self.win_length = win_length
+        self._COUNT = count
+        self._records = None
+
+    def __len__(self):
+        return self._COUNT
+
+    @classmethod
+    def open(cls, move_book_path=MOVE_BOOK_PATH):
+        """
+        Shared book at the given path, or None if no book was built there
+        """
+        move_book_path = os.path.abspath(move_book_path)
+        if move_book_path not in _OPEN_BOOKS:
+            _OPEN_BOOKS[move_book_path] = cls(move_book_path) if os.path.exists(move_book_path) else None
+        return _OPEN_BOOKS[move_book_path]
+
+    def lookup(self, mover_mask, other_mask):
+        """
+        Look a position up for the side to move
+        :return: (depth-adjusted score, list of best cells in the caller's orientation) or None
+        """
+        key, symmetry = canonical_position(mover_mask, other_mask, self.board_size)
+        low = 0
+        high = self._COUNT
+        while low < high:
+            middle = (low + high) // 2
+            record_key, best_cells, score = _RECORD.unpack_from(self._map, _HEADER.size + middle * _RECORD.size)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return score, [unmap_cell(cell, symmetry, self.board_size) for cell in mask_cells(best_cells)]
+        return None
+
+    def lookup_batch(self, mover_masks, other_masks):
+        """
+        Look many positions up at once for the side to move, with vectorized canonicalization and binary search
+        :param mover_masks: an (N,) int array of the side to move's cells
+        :param other_masks: an (N,) int array of the other side's cells
+        :return: a tuple of (N,) arrays with (whether the position is in the book, depth-adjusted score, lowest best cell in the caller's orientation)
+        """
+        # Only batch callers pay for the numpy import
+        import numpy as np
+
+        if self._records is None:
+            record_dtype = np.dtype([('key', '<u4'), ('best_cells', '<u2'), ('score', 'i1'), ('padding', 'V1')])
+            self._records = np.frombuffer(self._map, dtype=record_dtype, count=self._COUNT, offset=_HEADER.size)
+        cells = self.board_size * self.board_size
+        permutations = np.array(symmetry_permutations(self.board_size), dtype=np.int64)
+        shifts = np.arange(cells, dtype=np.int64)
+
+        # Bit j of a mask moves to bit permutation[j] under each symmetry
+        weights = np.int64(1) << permutations
+        mover_bits = (np.asarray(mover_masks, dtype=np.int64)[:, None] >> shifts) & 1
+        other_bits = (np.asarray(other_masks, dtype=np.int64)[:, None] >> shifts) & 1
+        keys = ((mover_bits @ weights.T) << cells) | (other_bits @ weights.T)
+        symmetries = keys.argmin(axis=1)
+        keys = keys[np.arange(len(keys)), symmetries]
+
+        indices = np.minimum(np.searchsorted(self._records['key'], keys), self._COUNT - 1)
+        records = self._records[indices]
+        found = records['key'] == keys
+
+        # Lowest best cell in the canonical orientation, mapped back through the inverse symmetry
+        best_cells = np.where(found, records['best_cells'], 1).astype(np.int64)
+        lowest_cells = np.log2(best_cells & -best_cells).astype(np.int64)
+        inverses = np.argsort(permutations, axis=1)
+        best_cells = np.where(found, inverses[symmetries, lowest_cells], -1)
+        return found, np.where(found, records['score'], 0), best_cells
+
+
+def main(board_size, win_length, move_book_path):
+    """
+    Move book builder
+    """
+    print('### SOLVING {0}x{0} K{1} POSITIONS ###'.format(board_size, win_length))
+
+    start_time = time.time()
+    book = _solve_positions(board_size, win_length)
+    write_move_book(book, board_size, win_length, move_book_path)
+
+    wins = sum(1 for score, _ in book.values() if score > 0)
+    losses = sum(1 for score, _ in book.values() if score < 0)
+    print('Positions: {0} (wins {1}, draws {2}, losses {3})'.format(len(book), wins, len(book) - wins - losses, losses))
+    print('Empty board value: {0}, best cells: {1}'.format(book[0][0], popcount(book[0][1])))
+    print('### BUILDING THE MOVE BOOK TOOK {0} SECONDS ###'.format(round(time.time() - start_time, 1)))
+
+
+def run():
+    """
+    Run the program using the cli inputs
+    """
+    BOARD_SIZE = 3
+    WIN_LENGTH = 3
+
+    main(BOARD_SIZE, WIN_LENGTH, MOVE_BOOK_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Perfect Play Move Book Builder')
+    args = parser.parse_args()
+
+    try:
+        run()
+    except Exception as e:
+        print(e)
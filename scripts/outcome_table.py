@@ -0,0 +1,140 @@
+from math import comb
+import mmap
+import os
+import struct
+
+from board import Board, mask_cells, popcount
+
+
+OUTCOME_TABLE_PATH = os.path.join(os.path.dirname(__file__), '../data/outcome_table.bin')
+
+# Header: magic, version, board size, win length, lowest solved piece count
+HEADER = struct.Struct('<4sBBBB')
+MAGIC = b'TTTR'
+VERSION = 1
+
+# Positions are ranked through tables indexed by cell masks, 2 ** cells entries each
+MAX_CELLS = 16
+
+# 2-bit outcomes for the side to move; UNSOLVED also marks finished and not yet solved positions
+UNSOLVED = 0
+LOSS = 1
+DRAW = 2
+WIN = 3
+
+# Opened tables shared by every engine of the process
+_OPEN_TABLES = {}
+_RANK_TABLES = {}
+
+
+def popcount_ranks(cells):
+    """
+    Build (and cache) the rank of every mask of cells bits among the masks of its popcount in increasing order,
+    which is also its rank among the narrower masks of that popcount
+    """
+    if cells not in _RANK_TABLES:
+        ranks = [0] * (1 << cells)
+        counts = [0] * (cells + 1)
+        for mask in range(1 << cells):
+            count = bin(mask).count('1')
+            ranks[mask] = counts[count]
+            counts[count] += 1
+        _RANK_TABLES[cells] = ranks
+    return _RANK_TABLES[cells]
+
+
+def layer_size(cells, pieces):
+    """
+    Positions of a piece count: the occupied cells, then which of them belong to the side to move (pieces // 2 of them)
+    """
+    return comb(cells, pieces) * comb(pieces, pieces // 2)
+
+
+def layer_offsets(cells):
+    """
+    Byte offset of each piece count's layer in the table file, 4 positions to the byte, and the file size
+    """
+    offsets = []
+    offset = HEADER.size
+    for pieces in range(cells + 1):
+        offsets.append(offset)
+        offset += (layer_size(cells, pieces) + 3) // 4
+    return offsets, offset
+
+
+def extract_bits(mask, occupied):
+    """
+    Bits of mask at the occupied cells, packed into the low bits in cell order
+    """
+    result = 0
+    for index, cell in enumerate(mask_cells(occupied)):
+        result |= ((mask >> cell) & 1) << index
+    return result
+
+
+class Outcome_Table():
+
+    def __init__(self, outcome_table_path):
+        """
+        Memory-map an outcome table written by the retrograde solver
+        """
+        with open(outcome_table_path, 'rb') as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, win_length, solved_layer = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{0} is not a version {1} outcome table'.format(outcome_table_path, VERSION))
+        self.board_size = board_size
+        self.win_length = win_length
+        # Layers of this piece count and above are solved
+        self.solved_layer = solved_layer
+        self._CELLS = board_size * board_size
+        self._OFFSETS = layer_offsets(self._CELLS)[0]
+        self._RANKS = popcount_ranks(self._CELLS)
+
+    def __len__(self):
+        return sum(layer_size(self._CELLS, pieces) for pieces in range(self._CELLS + 1))
+
+    @classmethod
+    def open(cls, outcome_table_path=OUTCOME_TABLE_PATH):
+        """
+        Shared table at the given path, or None if no table was solved there
+        """
+        outcome_table_path = os.path.abspath(outcome_table_path)
+        if outcome_table_path not in _OPEN_TABLES:
+            _OPEN_TABLES[outcome_table_path] = cls(outcome_table_path) if os.path.exists(outcome_table_path) else None
+        return _OPEN_TABLES[outcome_table_path]
+
+    def outcome(self, mover_mask, other_mask):
+        """
+        Game-theoretic outcome of a position for the side to move
+        :return: WIN, DRAW, LOSS, or UNSOLVED for finished, out of turn or not yet solved positions
+        """
+        occupied = mover_mask | other_mask
+        pieces = popcount(occupied)
+        if popcount(mover_mask) != pieces // 2 or pieces < self.solved_layer:
+            return UNSOLVED
+        rank = self._RANKS[occupied] * comb(pieces, pieces // 2) + self._RANKS[extract_bits(mover_mask, occupied)]
+        return (self._map[self._OFFSETS[pieces] + (rank >> 2)] >> ((rank & 3) * 2)) & 3
+
+    def best_cells(self, mover_mask, other_mask):
+        """
+        Cells keeping the outcome of the side to move, winning cells first
+        :return: a list of cells, empty when the position is finished or not solved
+        """
+        if self.outcome(mover_mask, other_mask) == UNSOLVED:
+            return []
+        board = Board(self.board_size, self.win_length, (mover_mask, other_mask))
+        winning_cells = [cell for cell in board.empty_cells() if board.wins_with(cell, 0)]
+        if len(winning_cells) > 0:
+            return winning_cells
+        best_outcome = UNSOLVED
+        best_cells = []
+        for cell in board.empty_cells():
+            # The opponent moves next, their loss being our win
+            outcome = WIN + LOSS - self.outcome(other_mask, mover_mask | (1 << cell))
+            if outcome > best_outcome:
+                best_outcome = outcome
+                best_cells = [cell]
+            elif outcome == best_outcome:
+                best_cells.append(cell)
+        return best_cells
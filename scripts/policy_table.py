@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import time
+
+from board import build_win_masks, mask_cells, popcount
+
+
+POLICY_TABLE_PATH = os.path.join(os.path.dirname(__file__), '../data/policy_table.json')
+
+AGGRESSIVE = 0
+DEFENSIVE = 1
+RANDOM = 2
+
+# Tables shared by every Game_AI of the same board size, the candidates do not depend on the genes
+_SHARED_TABLES = {}
+
+
+def line_candidates(own_mask, other_mask, empty_mask, lines, board_size):
+    """
+    Collect the empty cells of the lines free of other_mask holding the most own_mask cells, once per line
+    """
+    best_count = -1
+    position_choices = []
+    for line in lines:
+        if other_mask & line:
+            continue
+        count = popcount(own_mask & line)
+        if count >= board_size:
+            continue
+        if count > best_count:
+            best_count = count
+            position_choices = mask_cells(line & empty_mask)
+        elif count == best_count:
+            position_choices.extend(mask_cells(line & empty_mask))
+    return position_choices
+
+
+class Policy_Table():
+
+    def __init__(self, board_size=3):
+        """
+        Initialize an empty table of Game_AI candidate cells indexed by position code
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._CELLS = self._BOARD_SIZE * self._BOARD_SIZE
+        self._FULL_MASK = (1 << self._CELLS) - 1
+        self._LINES = build_win_masks(self._BOARD_SIZE)
+
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def shared(cls, board_size=3, policy_table_path=POLICY_TABLE_PATH):
+        """
+        Table shared by the process, loaded from disk when a table of that board size was saved there
+        """
+        board_size = int(board_size)
+        if board_size not in _SHARED_TABLES:
+            table = cls(board_size)
+            if policy_table_path and os.path.exists(policy_table_path):
+                table.load(policy_table_path)
+            _SHARED_TABLES[board_size] = table
+        return _SHARED_TABLES[board_size]
+
+    def candidates(self, self_mask, opponent_mask):
+        """
+        Aggressive, defensive and random candidate cells of a position, computed on first use
+        :return: a tuple of three tuples of cell indices, a cell repeated once per line it was chosen through
+        """
+        code = (self_mask << self._CELLS) | opponent_mask
+        entry = self._entries.get(code)
+        if entry is None:
+            empty_mask = self._FULL_MASK & ~(self_mask | opponent_mask)
+            entry = (tuple(line_candidates(self_mask, opponent_mask, empty_mask, self._LINES, self._BOARD_SIZE)),
+                     tuple(line_candidates(opponent_mask, self_mask, empty_mask, self._LINES, self._BOARD_SIZE)),
+                     tuple(mask_cells(empty_mask)))
+            self._entries[code] = entry
+        return entry
+
+    def build(self):
+        """
+        Fill the table with every position reachable by alternating moves
+        """
+        seen = set()
+        frontier = [(0, 0)]
+        while frontier:
+            mover, other = frontier.pop()
+            if (mover, other) in seen:
+                continue
+            seen.add((mover, other))
+            self.candidates(mover, other)
+            empty_mask = self._FULL_MASK & ~(mover | other)
+            for cell in mask_cells(empty_mask):
+                child = mover | (1 << cell)
+                if any(child & line == line for line in self._LINES):
+                    continue
+                frontier.append((other, child))
+
+    def save(self, policy_table_path):
+        """
+        Save the table as json
+        """
+        entries = {str(code): [list(candidates) for candidates in entry] for code, entry in self._entries.items()}
+        json.dump({'board_size': self._BOARD_SIZE, 'entries': entries}, open(policy_table_path, 'w'))
+
+    def load(self, policy_table_path):
+        """
+        Load a table saved for the same board size
+        """
+        saved = json.load(open(policy_table_path, 'r'))
+        if int(saved['board_size']) != self._BOARD_SIZE:
+            return
+        for code, entry in saved['entries'].items():
+            self._entries[int(code)] = tuple(tuple(candidates) for candidates in entry)
+
+
+def main(board_size, policy_table_path):
+    """
+    Policy table builder
+    """
+    start_time = time.time()
+    table = Policy_Table(board_size)
+    table.build()
+    table.save(policy_table_path)
+    print('### BUILT {0} POSITIONS IN {1} SECONDS ###'.format(len(table), round(time.time() - start_time, 1)))
+
+
+def run():
+    """
+    Run the program using the cli inputs
+    """
+    BOARD_SIZE = 3
+
+    main(BOARD_SIZE, POLICY_TABLE_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game AI Policy Table Builder')
+    args = parser.parse_args()
+
+    try:
+        run()
+    except Exception as e:
+        print(e)
@@ -0,0 +1,32 @@
+from board import lists_to_mask, mask_cells
+from random_stream import as_stream
+
+
+class Game_Random():
+
+    def __init__(self, board_size=3, rng=None):
+        """
+        Initialize the uniform-random baseline
+        :param rng: Random_Stream of the choices, or its seed (None, an int or a SeedSequence)
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._FULL_MASK = (1 << (self._BOARD_SIZE * self._BOARD_SIZE)) - 1
+        self._rng = as_stream(rng)
+
+    def choose_cell(self, self_mask, opponent_mask, log_choice=False):
+        """
+        Choose a uniformly random empty cell index on the bitboard representation
+        """
+        positions = mask_cells(self._FULL_MASK & ~(self_mask | opponent_mask))
+        if len(positions) == 0:
+            return
+        return positions[self._rng.index(len(positions))]
+
+    def choose_position(self, self_filled, opponent_filled, log_choice=False):
+        """
+        Choose the next fill position
+        """
+        cell = self.choose_cell(lists_to_mask(self_filled), lists_to_mask(opponent_filled), log_choice)
+        if cell is None:
+            return
+        return [cell // self._BOARD_SIZE, cell % self._BOARD_SIZE]
@@ -0,0 +1,65 @@
+from bisect import bisect_right
+import numpy as np
+
+
+# Uniform draws generated at once, the per-draw cost of numpy being mostly call overhead
+DEFAULT_BLOCK_SIZE = 1024
+
+
+class Random_Stream():
+
+    def __init__(self, seed=None, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Initialize an independent random stream drawing uniforms from its own numpy Generator in blocks
+        :param seed: None for fresh entropy, an int or a numpy SeedSequence
+        """
+        self._seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._BLOCK_SIZE = int(block_size)
+        # Numpy generator of the stream, for vectorized callers
+        self.generator = np.random.default_rng(self._seed_sequence)
+        self._block = []
+        self._index = 0
+
+    def random(self):
+        """
+        Next uniform float in [0, 1)
+        """
+        if self._index == len(self._block):
+            self._block = self.generator.random(self._BLOCK_SIZE).tolist()
+            self._index = 0
+        value = self._block[self._index]
+        self._index += 1
+        return value
+
+    def index(self, count):
+        """
+        Uniform index in [0, count)
+        """
+        return int(self.random() * count)
+
+    def weighted_index(self, cumulative_probabilities):
+        """
+        Index drawn by its probability, like numpy's choice with p (the cumulative probabilities ending at 1)
+        """
+        return bisect_right(cumulative_probabilities, self.random())
+
+    def spawn(self, count):
+        """
+        Independent child streams, e.g. one per parallel worker
+        """
+        return [Random_Stream(seed_sequence, self._BLOCK_SIZE) for seed_sequence in self._seed_sequence.spawn(count)]
+
+
+def as_stream(rng=None):
+    """
+    The given stream, or a new one seeded with rng (None, an int or a SeedSequence)
+    """
+    return rng if isinstance(rng, Random_Stream) else Random_Stream(rng)
+
+
+def cumulative_probabilities(probabilities):
+    """
+    Normalized cumulative probabilities of a weighted choice, as numpy's choice computes them
+    """
+    cumulative = np.cumsum(probabilities)
+    return (cumulative / cumulative[-1]).tolist()
@@ -0,0 +1,205 @@
+import argparse
+from math import comb
+import multiprocessing
+import numpy as np
+import os
+import resource
+import time
+
+from board import build_win_masks
+from outcome_table import DRAW, HEADER, LOSS, MAGIC, MAX_CELLS, OUTCOME_TABLE_PATH, UNSOLVED, VERSION, WIN, layer_offsets, layer_size, popcount_ranks
+
+
+# Positions solved by one task, bounding the memory of its arrays
+_CHUNK_POSITIONS = 1 << 18
+
+# Per-process tables of a board configuration: (popcount ranks, popcounts, whether each mask holds a winning line)
+_TABLES = {}
+
+
+def _tables(board_size, win_length):
+    """
+    Build (and cache) the mask-indexed numpy tables of a board configuration
+    """
+    key = (board_size, win_length)
+    if key not in _TABLES:
+        cells = board_size * board_size
+        masks = np.arange(1 << cells, dtype=np.int64)
+        popcounts = np.zeros(1 << cells, dtype=np.int64)
+        for cell in range(cells):
+            popcounts += (masks >> cell) & 1
+        has_line = np.zeros(1 << cells, dtype=bool)
+        for line in build_win_masks(board_size, win_length):
+            has_line |= (masks & line) == line
+        _TABLES[key] = (np.array(popcount_ranks(cells), dtype=np.int64), popcounts, has_line)
+    return _TABLES[key]
+
+
+def _layer_masks(popcounts, cells, pieces):
+    """
+    Occupied masks of a piece count and the patterns of the side to move's pieces among them, both in rank order
+    """
+    masks = np.arange(1 << cells, dtype=np.int64)
+    occupied = masks[popcounts == pieces]
+    patterns = masks[:1 << pieces][popcounts[:1 << pieces] == pieces // 2]
+    return occupied, patterns
+
+
+def _extract_bits(masks, occupied, cells, popcounts):
+    """
+    Vectorized extract_bits: bits of masks at the occupied cells, packed into the low bits in cell order
+    """
+    result = np.zeros(len(masks), dtype=np.int64)
+    for cell in range(cells):
+        is_kept = ((masks & occupied) >> cell) & 1
+        result |= is_kept << popcounts[occupied & ((1 << cell) - 1)]
+    return result
+
+
+def _solve_chunk(task):
+    """
+    Solve the positions of a range of occupied masks of a layer from the solved layer above it
+    :return: a uint8 array of the outcomes in rank order and the peak memory of the process in MB
+    """
+    table_path, board_size, win_length, pieces, start, stop = task
+    cells = board_size * board_size
+    ranks, popcounts, has_line = _tables(board_size, win_length)
+    occupied, patterns = _layer_masks(popcounts, cells, pieces)
+    occupied = occupied[start:stop]
+
+    # Deposit each pattern's bits onto the occupied cells, the side to move's masks laid out occupied-major as they are ranked
+    occupied_bits = (occupied[:, None] >> np.arange(cells, dtype=np.int64)) & 1
+    occupied_cells = np.argsort(-occupied_bits, axis=1, kind='stable')[:, :pieces]
+    pattern_bits = (patterns[:, None] >> np.arange(pieces, dtype=np.int64)) & 1
+    mover = (pattern_bits @ (np.int64(1) << occupied_cells).T).T.ravel()
+    occupied = np.repeat(occupied, len(patterns))
+    other = occupied & ~mover
+
+    outcomes = np.zeros(len(mover), dtype=np.uint8)
+    active = np.flatnonzero(~has_line[mover] & ~has_line[other])
+    if pieces == cells:
+        outcomes[active] = DRAW
+        return outcomes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    children = np.memmap(table_path, dtype=np.uint8, mode='r', offset=layer_offsets(cells)[0][pieces + 1], shape=((layer_size(cells, pieces + 1) + 3) // 4,))
+    child_patterns = comb(pieces + 1, (pieces + 1) // 2)
+    mover, other, occupied = mover[active], other[active], occupied[active]
+    best = np.zeros(len(active), dtype=np.uint8)
+    for cell in range(cells):
+        is_empty = ((occupied >> cell) & 1) == 0
+        moved = mover | (1 << cell)
+        is_win = is_empty & has_line[moved]
+        best[is_win] = WIN
+        playing = np.flatnonzero(is_empty & ~is_win)
+        # The opponent moves next in the child, their loss being our win
+        child_occupied = occupied[playing] | (1 << cell)
+        child_ranks = ranks[child_occupied] * child_patterns + ranks[_extract_bits(other[playing], child_occupied, cells, popcounts)]
+        child_outcomes = (children[child_ranks >> 2] >> ((child_ranks & 3) * 2).astype(np.uint8)) & 3
+        best[playing] = np.maximum(best[playing], WIN + LOSS - child_outcomes)
+    outcomes[active] = best
+    return outcomes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _pack_outcomes(outcomes):
+    """
+    Pack outcomes 4 to the byte, the first in the low bits
+    """
+    padded = np.zeros((len(outcomes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(outcomes)] = outcomes
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+
+def _write_header(table_file, board_size, win_length, solved_layer):
+    """
+    Write the header and make everything written so far durable
+    """
+    table_file.flush()
+    os.fsync(table_file.fileno())
+    table_file.seek(0)
+    table_file.write(HEADER.pack(MAGIC, VERSION, board_size, win_length, solved_layer))
+    table_file.flush()
+    os.fsync(table_file.fileno())
+
+
+def main(board_size, win_length, table_path, workers, resume):
+    """
+    Retrograde solver writing the 2-bit outcome of every position, layer by layer from the full board back to the empty one,
+    each layer split across the workers; a resumed run continues below the last layer it wrote
+    """
+    cells = board_size * board_size
+    if cells > MAX_CELLS:
+        raise ValueError('The outcome table ranks at most {0} cells'.format(MAX_CELLS))
+    offsets, table_size = layer_offsets(cells)
+
+    start_layer = cells
+    if resume and os.path.exists(table_path):
+        with open(table_path, 'rb') as table_file:
+            magic, version, table_board_size, table_win_length, solved_layer = HEADER.unpack(table_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or (table_board_size, table_win_length) != (board_size, win_length):
+            raise ValueError('{0} is not a version {1} outcome table of {2}x{2} k{3}'.format(table_path, VERSION, board_size, win_length))
+        start_layer = solved_layer - 1
+        print('### RESUMING {0}x{0} K{1} SOLVE AT {2} PIECES ###'.format(board_size, win_length, start_layer))
+    else:
+        with open(table_path, 'wb') as table_file:
+            table_file.write(HEADER.pack(MAGIC, VERSION, board_size, win_length, cells + 1))
+            table_file.truncate(table_size)
+        print('### SOLVING {0}x{0} K{1}: {2} POSITIONS IN {3} BYTES ###'.format(board_size, win_length, sum(layer_size(cells, pieces) for pieces in range(cells + 1)), table_size))
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    worker_memory = 0.0
+    start_time = time.time()
+    with open(table_path, 'r+b') as table_file:
+        for pieces in range(start_layer, -1, -1):
+            layer_start_time = time.time()
+            occupied_count = comb(cells, pieces)
+            chunk = max(_CHUNK_POSITIONS // comb(pieces, pieces // 2), 1)
+            tasks = [(table_path, board_size, win_length, pieces, start, min(start + chunk, occupied_count)) for start in range(0, occupied_count, chunk)]
+            results = pool.map(_solve_chunk, tasks) if pool is not None else [_solve_chunk(task) for task in tasks]
+            outcomes = np.concatenate([chunk_outcomes for chunk_outcomes, _ in results])
+            worker_memory = max([worker_memory] + [chunk_memory for _, chunk_memory in results])
+
+            table_file.seek(offsets[pieces])
+            table_file.write(_pack_outcomes(outcomes).tobytes())
+            _write_header(table_file, board_size, win_length, pieces)
+
+            tallies = np.bincount(outcomes, minlength=4)
+            solver_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            print('Pieces: {0:2d}, Positions: {1} (wins {2}, draws {3}, losses {4}, finished {5}), {6:.1f} seconds, Peak memory: {7:.0f} MB (largest worker {8:.0f} MB)'.format(
+                pieces, len(outcomes), tallies[WIN], tallies[DRAW], tallies[LOSS], tallies[UNSOLVED], time.time() - layer_start_time, solver_memory, worker_memory))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if start_layer >= 0:
+        print('Empty board value: {0}'.format({WIN: 'win', DRAW: 'draw', LOSS: 'loss'}[int(outcomes[0])]))
+    print('### SOLVING TOOK {0} SECONDS ###'.format(round(time.time() - start_time, 1)))
+
+
+def run(board_size, win_length, workers, resume, output):
+    """
+    Run the program using the cli inputs
+    """
+    BOARD_SIZE = int(board_size)
+    WIN_LENGTH = BOARD_SIZE if win_length is None else int(win_length)
+    WORKERS = max(int(workers), 1)
+    SHOULD_RESUME = bool(resume)
+    TABLE_PATH = output if output else OUTCOME_TABLE_PATH
+
+    main(BOARD_SIZE, WIN_LENGTH, TABLE_PATH, WORKERS, SHOULD_RESUME)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Retrograde Outcome Table Solver')
+    parser.add_argument('-n', '--board-size', dest='board_size', type=int, default=4, help='Solve an NxN board (at most 4x4)')
+    parser.add_argument('-k', '--win-length', dest='win_length', type=int, default=None, help='Pieces in a row needed to win (default: the board size)')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=1, help='Split each layer across this many worker processes')
+    parser.add_argument('-r', '--resume', dest='resume', action='store_true', help='Continue an interrupted solve below the last layer it wrote')
+    parser.add_argument('-o', '--output', dest='output', default=None, help='Table path (default: data/outcome_table.bin, the table the minimax loads for 4x4)')
+    args = parser.parse_args()
+
+    try:
+        run(args.board_size, args.win_length, args.workers, args.resume, args.output)
+    except Exception as e:
+        print(e)
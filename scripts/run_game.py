@@ -2,11 +2,13 @@ import argparse
 import json
 import pygame
 import sys
+import time
 
 from game import Game
+import metrics
 
 
-def main(board_width, board_height, title, fps, should_use_ai, ai_genes, should_use_minimax):
+def main(board_width, board_height, title, fps, should_use_ai, ai_genes, should_use_minimax, show_metrics=False, async_moves=False, ponder=False, should_use_mcts=False, record_path=None):
     """
     Main game loop
     """
@@ -15,24 +17,36 @@ def main(board_width, board_height, title, fps, should_use_ai, ai_genes, should_
     pygame.display.set_caption(title)
     pygame.font.init()
     clock = pygame.time.Clock()
-    game = Game(board_width, board_height, should_use_ai, ai_genes, should_use_minimax)
+    game = Game(board_width, board_height, should_use_ai, ai_genes, should_use_minimax, show_metrics=show_metrics, async_moves=async_moves, ponder=ponder, should_use_mcts=should_use_mcts, record_path=record_path)
 
     while True:
-        for event in pygame.event.get():
+        # Sleep until the next event when nothing can change without one
+        events = [pygame.event.wait()] + pygame.event.get() if game.is_idle() else pygame.event.get()
+        frame_start_time = time.perf_counter()
+        for event in events:
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                game.close()
+                if ponder:
+                    print('Pondering hits: {hits}, misses: {misses}, hit rate: {hit_rate:.2f}, search time saved: {time_saved:.3f} seconds'.format(**game.ponder_stats()))
                 pygame.quit()
                 sys.exit(0)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                game.notify_reset()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 game.notify_click(event.pos)
 
         game.draw(screen)
         game.update(screen)
 
-        pygame.display.update()
+        dirty_rects = game.pop_dirty_rects()
+        if len(dirty_rects) > 0:
+            pygame.display.update(dirty_rects)
+        if metrics.ENABLED:
+            metrics.observe('game.frame', time.perf_counter() - frame_start_time)
         clock.tick(fps)
 
 
-def run(should_use_ai, should_use_minimax):
+def run(should_use_ai, should_use_minimax, metrics_path, show_metrics, async_moves, ponder, should_use_mcts=False, record_path=None):
     """
     Run the program using the cli inputs
     """
@@ -49,18 +63,32 @@ def run(should_use_ai, should_use_minimax):
         AI_GENES = (float(ai_genes_dict['aggressive_gene']), float(ai_genes_dict['defensive_gene']), float(ai_genes_dict['random_gene']))
 
     SHOULD_USE_MINIMAX = bool(should_use_minimax)
+    SHOULD_USE_MCTS = bool(should_use_mcts)
+    SHOW_METRICS = bool(show_metrics)
+    ASYNC_MOVES = bool(async_moves)
+    PONDER = bool(ponder)
+    RECORD_PATH = record_path
 
-    main(BOARD_WIDTH, BOARD_HEIGHT, TITLE, FPS, SHOULD_USE_AI, AI_GENES, SHOULD_USE_MINIMAX)
+    if metrics_path or SHOW_METRICS:
+        metrics.enable(metrics_path)
+
+    main(BOARD_WIDTH, BOARD_HEIGHT, TITLE, FPS, SHOULD_USE_AI, AI_GENES, SHOULD_USE_MINIMAX, SHOW_METRICS, ASYNC_MOVES, PONDER, SHOULD_USE_MCTS, RECORD_PATH)
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Tic Toe Game vs Evolution AI vs Minimax')
+    parser = argparse.ArgumentParser(description='Tic Toe Game vs Evolution AI vs Minimax vs MCTS')
     parser.add_argument('-e', '--use-ai', dest='use_ai', action='store_true', help='Enable the evolutionary algorithm and instead play a 2-person game')
     parser.add_argument('-m', '--use-minimax', dest='use_minimax', action='store_true',
                         help='Enable the minimax and instead play a 2-person game')
+    parser.add_argument('-t', '--use-mcts', dest='use_mcts', action='store_true', help='Enable the monte carlo tree search (one second per move) and instead play a 2-person game')
+    parser.add_argument('--metrics', dest='metrics', default=None, help='Record frame and ai move timings, dumped as json to this path at exit')
+    parser.add_argument('--overlay', dest='overlay', action='store_true', help='Show the frame and ai move timings on screen')
+    parser.add_argument('-a', '--async', dest='async_moves', action='store_true', help='Let the ai think on a worker thread so the window stays responsive (press r to restart a game)')
+    parser.add_argument('-p', '--ponder', dest='ponder', action='store_true', help='Let the ai compute its reply to every move while you think (implies -a)')
+    parser.add_argument('--record', dest='record', default=None, help='Append every game to this compact game record file')
     args = parser.parse_args()
 
     try:
-        run(args.use_ai, args.use_minimax)
+        run(args.use_ai, args.use_minimax, args.metrics, args.overlay, args.async_moves, args.ponder, args.use_mcts, args.record)
     except Exception as e:
         print(e)
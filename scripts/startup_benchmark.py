@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# Modules timed by default, from the pure python board up to the pygame ui
+DEFAULT_MODULES = ['board', 'minimax', 'core', 'train_genes', 'tournament', 'game_server', 'game']
+
+# Libraries worth flagging when a module pulls them in
+HEAVY_LIBRARIES = ['numpy', 'pygame', 'matplotlib']
+
+_PROBE = """
+import sys, time, json
+start_time = time.perf_counter()
+import {module}
+print(json.dumps([time.perf_counter() - start_time, [library for library in {libraries!r} if library in sys.modules]]))
+"""
+
+
+def _time_import(module, scripts_path):
+    """
+    Import a module in a fresh interpreter
+    :return: a tuple with (interpreter wall time, import time, heavy libraries loaded)
+    """
+    start_time = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, libraries=HEAVY_LIBRARIES)], cwd=scripts_path, env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1'),
+                            stdout=subprocess.PIPE, check=True).stdout
+    wall_time = time.perf_counter() - start_time
+    import_time, libraries = json.loads(output.decode().strip().splitlines()[-1])
+    return wall_time, import_time, libraries
+
+
+def main(modules, runs):
+    """
+    Interpreter startup benchmark
+    """
+    scripts_path = os.path.dirname(os.path.abspath(__file__))
+
+    print('### TIMING {0} FRESH INTERPRETERS PER MODULE ###'.format(runs))
+    width = max(len(module) for module in modules) + 2
+    for module in modules:
+        samples = sorted(_time_import(module, scripts_path) for _ in range(runs))
+        wall_time, import_time, libraries = samples[len(samples) // 2]
+        print('{0}Startup: {1:.0f} ms, Import: {2:.0f} ms, Loads: {3}'.format(module.ljust(width), 1000.0 * wall_time, 1000.0 * import_time, ', '.join(libraries) if libraries else '-'))
+
+
+def run(modules, runs):
+    """
+    Run the program using the cli inputs
+    """
+    MODULES = list(modules) if modules else DEFAULT_MODULES
+    RUNS = max(int(runs), 1)
+
+    main(MODULES, RUNS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Interpreter Startup Benchmark')
+    parser.add_argument('-m', '--modules', dest='modules', nargs='*', help='Modules to import (default: {0})'.format(' '.join(DEFAULT_MODULES)))
+    parser.add_argument('-n', '--runs', dest='runs', type=int, default=5, help='Fresh interpreters per module, the median is reported')
+    args = parser.parse_args()
+
+    try:
+        run(args.modules, args.runs)
+    except Exception as e:
+        print(e)
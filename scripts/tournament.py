@@ -0,0 +1,176 @@
+import argparse
+import json
+import math
+import numpy as np
+import os
+import time
+
+from board import Board, PLAYER_1, PLAYER_2
+from game_ai import Game_AI
+from mcts import Game_MCTS
+import metrics
+from minimax import Game_Minimax
+from random_ai import Game_Random
+
+
+ELO_BASE = 1500
+ELO_ITERATIONS = 200
+
+
+def _load_genes(genes_path):
+    """
+    Load genes saved by the trainer
+    """
+    genes_dict = json.load(open(genes_path, 'r'))
+    return (float(genes_dict['aggressive_gene']), float(genes_dict['defensive_gene']), float(genes_dict['random_gene']))
+
+
+def _build_engines(genes_paths, use_minimax, use_random, seed=None, mcts_playouts=None):
+    """
+    Build the (name, engine) entrants of the tournament, each with its own child stream of the seed
+    """
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(genes_paths) + 3))
+    engines = []
+    if use_minimax:
+        engines.append(('minimax', Game_Minimax(rng=next(seeds))))
+    if mcts_playouts:
+        engines.append(('mcts:{0}'.format(mcts_playouts), Game_MCTS(playouts=mcts_playouts, rng=next(seeds))))
+    for genes_path in genes_paths:
+        genes = _load_genes(genes_path)
+        engines.append(('ai:{0}'.format(os.path.splitext(os.path.basename(genes_path))[0]), Game_AI(genes[0], genes[1], genes[2], rng=next(seeds))))
+    if use_random:
+        engines.append(('random', Game_Random(rng=next(seeds))))
+    return engines
+
+
+def _play_game(engine_1, engine_2, latencies_1, latencies_2, starting_player=PLAYER_1):
+    """
+    Plays a game between two engines, appending every choose_cell latency
+    :return: PLAYER_1 or PLAYER_2 for a win, -1 for a tie
+    """
+    board = Board(3)
+    filled = board.filled
+
+    current_player = starting_player
+    while True:
+        if current_player == PLAYER_1:
+            start_time = time.perf_counter()
+            new_cell = engine_1.choose_cell(filled[PLAYER_1], filled[PLAYER_2])
+            latencies_1.append(time.perf_counter() - start_time)
+        else:
+            start_time = time.perf_counter()
+            new_cell = engine_2.choose_cell(filled[PLAYER_2], filled[PLAYER_1])
+            latencies_2.append(time.perf_counter() - start_time)
+        if board.wins_with(new_cell, current_player):
+            return current_player
+        board.move(new_cell, current_player)
+        if board.is_full():
+            return -1
+        current_player = 1 - current_player
+
+
+def _elo_ratings(wins, ties):
+    """
+    Elo ratings fitted to the whole result matrix (Bradley-Terry, ties counted as half a win)
+    One virtual tie against every opponent keeps unbeaten or winless engines finite
+    """
+    count = len(wins)
+    scores = [[wins[i][j] + 0.5 * ties[i][j] + (0.5 if i != j else 0.0) for j in range(count)] for i in range(count)]
+    strengths = [1.0] * count
+    for _ in range(ELO_ITERATIONS):
+        updated = []
+        for i in range(count):
+            total_score = sum(scores[i])
+            expected = sum((scores[i][j] + scores[j][i]) / (strengths[i] + strengths[j]) for j in range(count) if j != i)
+            updated.append(total_score / expected if expected > 0 else strengths[i])
+        mean_log = sum(math.log(strength) for strength in updated) / count
+        strengths = [strength / math.exp(mean_log) for strength in updated]
+    return [ELO_BASE + 400 * math.log10(strength) for strength in strengths]
+
+
+def main(engines, games_per_pair, results_path):
+    """
+    Round-robin tournament between the engines
+    """
+    names = [name for name, _ in engines]
+    count = len(engines)
+    wins = [[0] * count for _ in range(count)]
+    ties = [[0] * count for _ in range(count)]
+    latencies = [[] for _ in range(count)]
+    games_played = [0] * count
+
+    print('### STARTING TOURNAMENT ###')
+
+    start_time = time.time()
+
+    for i in range(count):
+        for j in range(i + 1, count):
+            starting_player = PLAYER_1
+            for _ in range(games_per_pair):
+                winner = _play_game(engines[i][1], engines[j][1], latencies[i], latencies[j], starting_player)
+                if winner == PLAYER_1:
+                    wins[i][j] += 1
+                elif winner == PLAYER_2:
+                    wins[j][i] += 1
+                else:
+                    ties[i][j] += 1
+                    ties[j][i] += 1
+                starting_player = 1 - starting_player
+            games_played[i] += games_per_pair
+            games_played[j] += games_per_pair
+
+    print('### RUNNING TOURNAMENT TOOK {0} SECONDS ###'.format(round(time.time() - start_time, 1)))
+
+    ratings = _elo_ratings(wins, ties)
+    width = max(len(name) for name in names) + 2
+
+    print('Wins (row beat column) / Ties')
+    print(''.join(name.rjust(width) for name in [''] + names))
+    for i in range(count):
+        print(names[i].rjust(width) + ''.join(('-' if i == j else '{0}/{1}'.format(wins[i][j], ties[i][j])).rjust(width) for j in range(count)))
+
+    print('--------------------------------------------------')
+    report = []
+    for i in sorted(range(count), key=lambda i: -ratings[i]):
+        engine_latencies = np.array(latencies[i]) * 1000.0
+        p50, p95, p99 = np.percentile(engine_latencies, [50, 95, 99])
+        games_per_second = games_played[i] / engine_latencies.sum() * 1000.0 if engine_latencies.sum() > 0 else float('inf')
+        print('{0}Elo: {1}, Games/sec: {2}, choose_cell latency p50/p95/p99: {3:.3f}/{4:.3f}/{5:.3f} ms'.format(names[i].ljust(width), int(round(ratings[i])), int(games_per_second), p50, p95, p99))
+        report.append({'engine': names[i], 'elo': ratings[i], 'games_per_second': games_per_second, 'latency_ms': {'p50': p50, 'p95': p95, 'p99': p99}})
+
+    if results_path:
+        json.dump({'engines': names, 'wins': wins, 'ties': ties, 'ratings': report}, open(results_path, 'w'), indent=2)
+
+
+def run(genes_paths, games_per_pair, use_minimax, use_random, seed, results_path, metrics_path, mcts_playouts=None):
+    """
+    Run the program using the cli inputs
+    """
+    GENES_PATHS = list(genes_paths) if genes_paths else [os.path.join(os.path.dirname(__file__), '../data/best_genes.json')]
+    GAMES_PER_PAIR = int(games_per_pair)
+    SEED = None if seed is None else int(seed)
+    MCTS_PLAYOUTS = None if mcts_playouts is None else int(mcts_playouts)
+
+    if metrics_path:
+        metrics.enable(metrics_path)
+
+    engines = _build_engines(GENES_PATHS, bool(use_minimax), bool(use_random), SEED, MCTS_PLAYOUTS)
+    main(engines, GAMES_PER_PAIR, results_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tic Toe Game Headless Engine Tournament')
+    parser.add_argument('-g', '--genes', dest='genes', nargs='*', help='Gene files of the evolutionary ai entrants (default: data/best_genes.json)')
+    parser.add_argument('-n', '--games', dest='games', type=int, default=200, help='Games per pairing, alternating the starting engine')
+    parser.add_argument('--no-minimax', dest='use_minimax', action='store_false', help='Leave the minimax out of the tournament')
+    parser.add_argument('--no-random', dest='use_random', action='store_false', help='Leave the uniform-random baseline out of the tournament')
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=None, help='Seed the engines')
+    parser.add_argument('-t', '--mcts', dest='mcts', type=int, default=None, help='Add a monte carlo tree search entrant running this many playouts per move')
+    parser.add_argument('-o', '--output', dest='output', default=None, help='Also save the matrices and ratings as json')
+    parser.add_argument('--metrics', dest='metrics', default=None, help='Record engine call latencies and minimax nodes, dumped as json to this path at exit')
+    args = parser.parse_args()
+
+    try:
+        run(args.genes, args.games, args.use_minimax, args.use_random, args.seed, args.output, args.metrics, args.mcts)
+    except Exception as e:
+        print(e)
@@ -1,28 +1,49 @@
 import argparse
 import json
-from matplotlib import pyplot as plt
+import math
+import multiprocessing
 import numpy as np
 import os
 import time
 
+from batch_simulator import play_games
+from board import Board, PLAYER_1, PLAYER_2
+from exact_evaluator import Exact_Evaluator
 from game_ai import Game_AI
+import game_record
+from matchup_cache import MATCHUP_CACHE_PATH, Matchup_Cache
+from mcts import Game_MCTS
+import metrics
 
 
 PLAYER1 = 'PLAYER 1'
 PLAYER2 = 'PLAYER 2'
 TIE = 'Tie'
 
+# Games per independently seeded chunk of an epoch; fixed so results do not depend on the worker count
+EPOCH_CHUNK_SIZE = 100
+BATCH_EPOCH_CHUNK_SIZE = 1000
 
-def _build_random_gene_mutation(best_genes, evolution_rate):
+TRAINING_LOG_PATH = os.path.join(os.path.dirname(__file__), '../data/training_log.jsonl')
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '../data/training_checkpoint.json')
+
+# Game record outcome of each result
+_RECORD_OUTCOMES = {PLAYER1: game_record.PLAYER_1_WINS, PLAYER2: game_record.PLAYER_2_WINS, TIE: game_record.TIE}
+
+# Cycles plotted at most, older samples are thinned out so the plot memory stays bounded
+PLOT_SAMPLES = 4096
+
+
+def _build_random_gene_mutation(best_genes, evolution_rate, rng=np.random):
     """
     Build a random mutation of the best genes based on the specified evolution rate
     """
-    aggressive_mutation = np.random.random()
-    defensive_mutation = np.random.random()
-    random_mutation = np.random.random()
+    aggressive_mutation = rng.random()
+    defensive_mutation = rng.random()
+    random_mutation = rng.random()
 
-    aggressive_mutation = np.random.choice([1, -1]) * evolution_rate * aggressive_mutation / (aggressive_mutation + defensive_mutation + random_mutation)
-    defensive_mutation = np.random.choice([1, -1]) * evolution_rate * defensive_mutation / (aggressive_mutation + defensive_mutation + random_mutation)
+    aggressive_mutation = rng.choice([1, -1]) * evolution_rate * aggressive_mutation / (aggressive_mutation + defensive_mutation + random_mutation)
+    defensive_mutation = rng.choice([1, -1]) * evolution_rate * defensive_mutation / (aggressive_mutation + defensive_mutation + random_mutation)
 
     evolved_genes = [0, 0, 0]
     evolved_genes[0] = int(min(max(best_genes[0] + aggressive_mutation, 0), 100))
@@ -33,57 +54,233 @@ def _build_random_gene_mutation(best_genes, evolution_rate):
     return evolved_genes
 
 
-def _check_winner(player_1_filled, player_2_filled):
-    """
-    Check if the game is over based on the player filled tuples
-    """
-    for i in range(3):
-        if (sum([player_1_filled[i][j] for j in range(3)]) > 2) or (sum([player_1_filled[j][i] for j in range(3)]) > 2):
-            return(PLAYER1)
-        elif (sum([player_2_filled[i][j] for j in range(3)]) > 2) or (sum([player_2_filled[j][i] for j in range(3)]) > 2):
-            return(PLAYER2)
-    if (player_1_filled[0][0] + player_1_filled[1][1] + player_1_filled[2][2] > 2) or (player_1_filled[0][2] + player_1_filled[1][1] + player_1_filled[2][0] > 2):
-        return(PLAYER1)
-    if (player_2_filled[0][0] + player_2_filled[1][1] + player_2_filled[2][2] > 2) or (player_2_filled[0][2] + player_2_filled[1][1] + player_2_filled[2][0] > 2):
-        return(PLAYER2)
-    if sum([sum([player_1_filled[i][j] for i in range(3)]) for j in range(3)]) + sum([sum([player_2_filled[i][j] for i in range(3)]) for j in range(3)]) > 8:
-        return(TIE)
-
-
-def _play_game(ai1, ai2, starting_player=PLAYER1, board_size=3):
+def _play_game(ai1, ai2, starting_player=PLAYER1, board_size=3, win_length=None, moves=None):
     """
-    Plays a game between the two AIs
+    Plays a game between the two AIs, checking only the lines through each new cell for a win
+    :param moves: list the filled cells are appended to, if given
     """
-    player_1_filled = [[0 for j in range(board_size)] for i in range(board_size)]
-    player_2_filled = [[0 for j in range(board_size)] for i in range(board_size)]
+    board = Board(board_size, win_length)
+    filled = board.filled
 
-    is_game_over = False
     current_player = starting_player
-    while not is_game_over:
+    while True:
         if current_player == PLAYER1:
-            new_position = ai1.choose_position(player_1_filled, player_2_filled)
-            player_1_filled[new_position[0]][new_position[1]] = 1
+            new_cell = ai1.choose_cell(filled[PLAYER_1], filled[PLAYER_2])
+            player = PLAYER_1
         else:
-            new_position = ai2.choose_position(player_2_filled, player_1_filled)
-            player_2_filled[new_position[0]][new_position[1]] = 1
+            new_cell = ai2.choose_cell(filled[PLAYER_2], filled[PLAYER_1])
+            player = PLAYER_2
+        if moves is not None:
+            moves.append(new_cell)
+        if board.wins_with(new_cell, player):
+            return current_player
+        board.move(new_cell, player)
+        if board.is_full():
+            return TIE
         current_player = PLAYER2 if current_player == PLAYER1 else PLAYER1
-        winner = _check_winner(player_1_filled, player_2_filled)
-        if winner:
-            return winner
 
 
-def _export_gene_evolution_plot(best_genes_log, gene_plot_path):
+def _play_epoch_chunk(task):
+    """
+    Play one independently seeded chunk of an epoch, alternating the starting player from PLAYER1
+    :return: the results, and the packed game records if asked for (the batch simulator records none)
+    """
+    best_genes, evolved_genes, num_games, seed_sequence, use_batch_simulator, board_size, win_length, should_record = task
+    if use_batch_simulator:
+        return play_games(best_genes, evolved_genes, num_games, board_size, np.random.default_rng(seed_sequence), win_length), []
+
+    # Each ai draws from its own child stream of the chunk seed
+    seed_1, seed_2 = seed_sequence.spawn(2)
+    ai1 = Game_AI(best_genes[0], best_genes[1], best_genes[2], board_size, seed_1, win_length)
+    ai2 = Game_AI(evolved_genes[0], evolved_genes[1], evolved_genes[2], board_size, seed_2, win_length)
+
+    results = {}
+    results[PLAYER1] = 0
+    results[PLAYER2] = 0
+    results[TIE] = 0
+
+    records = []
+    moves = [] if should_record else None
+    starting_player = PLAYER1
+    for _ in range(num_games):
+        winner = _play_game(ai1, ai2, starting_player, board_size, win_length, moves)
+        results[winner] += 1
+        if should_record:
+            records.extend(game_record.pack_record(moves, _RECORD_OUTCOMES[winner], 0 if starting_player == PLAYER1 else 1, game_record.ENGINE_IDS['ai'], game_record.ENGINE_IDS['ai'], board_size))
+            moves.clear()
+        starting_player = PLAYER2 if starting_player == PLAYER1 else PLAYER1
+    return results, records
+
+
+def validate_against_mcts(genes, games, playouts, board_size=3, win_length=None, seed=None):
+    """
+    Play the genes against a fixed-playout monte carlo tree search, alternating the starting player
+    :return: a dict of PLAYER1 (the genes), PLAYER2 (the search) and TIE tallies
+    """
+    ai_seed, mcts_seed = np.random.SeedSequence(seed).spawn(2)
+    ai = Game_AI(genes[0], genes[1], genes[2], board_size, ai_seed, win_length)
+    mcts = Game_MCTS(board_size, win_length, playouts, rng=mcts_seed)
+    results = {PLAYER1: 0, PLAYER2: 0, TIE: 0}
+    for game in range(games):
+        results[_play_game(ai, mcts, PLAYER1 if game % 2 == 0 else PLAYER2, board_size, win_length)] += 1
+    return results
+
+
+def _sprt_bounds(confidence):
+    """
+    Lower and upper log-likelihood ratio bounds of a sequential probability ratio test with equal error rates
+    """
+    error = 1.0 - confidence
+    return math.log(error / (1.0 - error)), math.log((1.0 - error) / error)
+
+
+def _sprt_log_likelihood_ratio(wins, losses, margin):
+    """
+    Log-likelihood ratio of the evolved genes winning a decisive game with probability 0.5 + margin rather than 0.5 - margin
+    """
+    p0 = 0.5 - margin
+    p1 = 0.5 + margin
+    return wins * math.log(p1 / p0) + losses * math.log((1.0 - p1) / (1.0 - p0))
+
+
+def _sprt_decision(results, margin, lower_bound, upper_bound):
+    """
+    True/False if the test decides the evolved genes (PLAYER2) are better/worse, else None
+    """
+    log_likelihood_ratio = _sprt_log_likelihood_ratio(results[PLAYER2], results[PLAYER1], margin)
+    if log_likelihood_ratio >= upper_bound:
+        return True
+    if log_likelihood_ratio <= lower_bound:
+        return False
+    return None
+
+
+def _play_epoch(best_genes, evolved_genes, epoch_size, epoch_seed, use_batch_simulator, pool=None, workers=1, sprt=None, board_size=3, win_length=None, prior=None, recorder=None):
+    """
+    Play an epoch as fixed-size chunks, each with its own child seed, on the pool if one is given.
+    With sprt=(margin, confidence) the epoch stops at the first chunk after which the test is decided
+    :param prior: (best wins, evolved wins, ties) of earlier games of the matchup, added to the results; only the games missing from
+    an epoch are played, and none when the prior games already decide the test
+    :param recorder: Game_Record_Writer the games of the counted chunks are appended to, best genes as player 1
+    :return: a tuple with (the results, True/False if the test decided the evolved genes are better/worse, else None)
+    """
+    if sprt is not None:
+        lower_bound, upper_bound = _sprt_bounds(sprt[1])
+
+    results = {}
+    results[PLAYER1] = 0 if prior is None else prior[0]
+    results[PLAYER2] = 0 if prior is None else prior[1]
+    results[TIE] = 0 if prior is None else prior[2]
+    if prior is not None:
+        decision = _sprt_decision(results, sprt[0], lower_bound, upper_bound) if sprt is not None else None
+        if decision is not None or sum(prior) >= epoch_size:
+            return results, decision
+
+    # Topped up to epoch_size games, so cached and uncached matchups are decided on samples of the same size
+    games = epoch_size if prior is None else epoch_size - sum(prior)
+    chunk_size = BATCH_EPOCH_CHUNK_SIZE if use_batch_simulator and sprt is None else EPOCH_CHUNK_SIZE
+    chunk_sizes = [min(chunk_size, games - offset) for offset in range(0, games, chunk_size)]
+    tasks = [(best_genes, evolved_genes, chunk_size, chunk_seed, use_batch_simulator, board_size, win_length, recorder is not None) for chunk_size, chunk_seed in zip(chunk_sizes, epoch_seed.spawn(len(chunk_sizes)))]
+    # Without a test the whole epoch is one round, with one it is played a round of workers chunks at a time
+    round_size = len(tasks) if sprt is None else workers
+
+    for offset in range(0, len(tasks), round_size):
+        round_tasks = tasks[offset:offset + round_size]
+        chunk_results = pool.map(_play_epoch_chunk, round_tasks) if pool is not None else [_play_epoch_chunk(task) for task in round_tasks]
+        # Chunks are added and tested in order, so where the test stops never depends on the worker count
+        for chunk, records in chunk_results:
+            if recorder is not None:
+                recorder.extend(records)
+            results[PLAYER1] += chunk[PLAYER1]
+            results[PLAYER2] += chunk[PLAYER2]
+            results[TIE] += chunk[TIE]
+            if sprt is not None:
+                decision = _sprt_decision(results, sprt[0], lower_bound, upper_bound)
+                if decision is not None:
+                    return results, decision
+    return results, None
+
+
+def benchmark_workers(max_workers, epoch_size, evolution_cycles, use_batch_simulator, seed=None):
+    """
+    Report games/sec and scaling efficiency of epoch evaluation for increasing worker counts
+    """
+    worker_counts = sorted(set([2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers] + [max_workers]))
+    total_games = epoch_size * evolution_cycles
+
+    print('### BENCHMARKING {0} GAMES PER WORKER COUNT ###'.format(total_games))
+    base_games_per_second = None
+    for workers in worker_counts:
+        epoch_seeds = np.random.SeedSequence(seed).spawn(evolution_cycles)
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        start_time = time.time()
+        for epoch_seed in epoch_seeds:
+            _play_epoch((40, 40, 20), (60, 40, 0), epoch_size, epoch_seed, use_batch_simulator, pool)
+        elapsed = time.time() - start_time
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        games_per_second = total_games / elapsed
+        if base_games_per_second is None:
+            base_games_per_second = games_per_second
+        print('Workers: {0}, Games/sec: {1}, Scaling efficiency: {2}%'.format(workers, int(games_per_second), int(100 * games_per_second / (base_games_per_second * workers))))
+
+
+class _Gene_Samples():
+
+    def __init__(self, max_samples=PLOT_SAMPLES):
+        """
+        Initialize a bounded sample of the best genes per cycle, keeping every stride-th cycle
+        """
+        self._MAX_SAMPLES = int(max_samples)
+        self.stride = 1
+        self.cycles = []
+        self.genes = []
+
+    def append(self, cycle, genes):
+        """
+        Sample the best genes of a cycle, halving the sample rate whenever the sample is full
+        """
+        if cycle % self.stride != 0:
+            return
+        self.cycles.append(cycle)
+        self.genes.append(genes)
+        if len(self.cycles) > self._MAX_SAMPLES:
+            self.stride *= 2
+            kept = [index for index, sampled_cycle in enumerate(self.cycles) if sampled_cycle % self.stride == 0]
+            self.cycles = [self.cycles[index] for index in kept]
+            self.genes = [self.genes[index] for index in kept]
+
+    @classmethod
+    def from_log(cls, training_log_path, max_samples=PLOT_SAMPLES):
+        """
+        Sample a training log one line at a time
+        """
+        samples = cls(max_samples)
+        if os.path.exists(training_log_path):
+            with open(training_log_path, 'r') as training_log:
+                for line in training_log:
+                    record = json.loads(line)
+                    samples.append(record['cycle'], record['best_genes'])
+        return samples
+
+
+def _export_gene_evolution_plot(gene_samples, gene_plot_path):
     """
     Build and export a png plot depicting the evolution of the best genes
     """
+    # Plotting is the only use of matplotlib, the slowest import of the trainer
+    from matplotlib import pyplot as plt
+
     plt.rcParams["figure.figsize"] = (16, 9)
 
     axes = plt.gca()
     axes.set_ylim([0, 100])
 
-    plt.plot(list(range(len(best_genes_log))), [best_genes_log[i][0] for i in range(len(best_genes_log))], color='red', label='Aggressive')
-    plt.plot(list(range(len(best_genes_log))), [best_genes_log[i][1] for i in range(len(best_genes_log))], color='green', label='Defensive')
-    plt.plot(list(range(len(best_genes_log))), [best_genes_log[i][2] for i in range(len(best_genes_log))], color='blue', label='Random')
+    plt.plot(gene_samples.cycles, [genes[0] for genes in gene_samples.genes], color='red', label='Aggressive')
+    plt.plot(gene_samples.cycles, [genes[1] for genes in gene_samples.genes], color='green', label='Defensive')
+    plt.plot(gene_samples.cycles, [genes[2] for genes in gene_samples.genes], color='blue', label='Random')
     plt.legend(loc='upper left')
 
     plt.title('Gene Evolution')
@@ -94,73 +291,235 @@ def _export_gene_evolution_plot(best_genes_log, gene_plot_path):
     plt.clf()
 
 
-def main(evolution_cycles, epoch_size, starting_genes, evolution_rate, best_genes_path, gene_plot_path, show_evolution_output):
+def _save_best_genes(best_genes, best_genes_path):
     """
-    Game AI trainer
+    Save the best genes as json
     """
-    best_genes_log = []
-    best_genes = starting_genes
+    best_genes_dict = {'aggressive_gene': float(best_genes[0]), 'defensive_gene': float(best_genes[1]), 'random_gene': float(best_genes[2])}
+    json.dump(best_genes_dict, open(best_genes_path, 'w'))
 
-    print('### STARTING EVOLUTION ###')
 
-    start_time = time.time()
+def _build_checkpoint(cycle, best_genes, total_games, elapsed, mutation_rng, games_seed, training_log, recorder=None):
+    """
+    Json-ready trainer state before the given cycle, with the generator states and the training log and game record sizes
+    """
+    games_state = {'entropy': games_seed.entropy, 'spawn_key': list(games_seed.spawn_key), 'n_children_spawned': games_seed.n_children_spawned}
+    return {'cycle': cycle, 'best_genes': list(best_genes), 'total_games': total_games, 'elapsed': elapsed,
+            'mutation_rng': mutation_rng.bit_generator.state, 'games_seed': games_state, 'log_size': training_log.tell(),
+            'records_size': recorder.size() if recorder is not None else None}
 
-    for i in range(evolution_cycles):
-        evolved_genes = _build_random_gene_mutation(best_genes, evolution_rate)
 
-        ai1 = Game_AI(best_genes[0], best_genes[1], best_genes[2])
-        ai2 = Game_AI(evolved_genes[0], evolved_genes[1], evolved_genes[2])
+def _save_training_state(checkpoint, training_log, best_genes_path, gene_samples, gene_plot_path, checkpoint_path, matchup_cache=None, matchup_cache_path=None):
+    """
+    Sync the training log, save the best genes, the plot and the matchup cache, then atomically replace the checkpoint so a crash while saving keeps the previous one
+    """
+    training_log.flush()
+    os.fsync(training_log.fileno())
+    _save_best_genes(checkpoint['best_genes'], best_genes_path)
+    _export_gene_evolution_plot(gene_samples, gene_plot_path)
+    if matchup_cache is not None:
+        matchup_cache.save(matchup_cache_path)
+
+    temporary_path = checkpoint_path + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+
+def main(evolution_cycles, epoch_size, starting_genes, evolution_rate, best_genes_path, gene_plot_path, show_evolution_output, use_batch_simulator=False, workers=1, seed=None, sprt=None, use_exact_evaluator=False,
+         training_log_path=TRAINING_LOG_PATH, checkpoint_path=CHECKPOINT_PATH, checkpoint_interval=100, resume=False, board_size=3, win_length=None,
+         mcts_playouts=None, mcts_games=100, matchup_cache_path=None, max_cached_matchups=100000, game_records_path=None):
+    """
+    Game AI trainer for k-in-a-row on an NxN board, streaming every cycle to the training log and checkpointing its state every checkpoint_interval cycles
+    :param mcts_playouts: validate the best genes against a monte carlo tree search of this many playouts per move, None to skip it
+    :param matchup_cache_path: tallies of every matchup played are kept there across runs and reused for repeated matchups, None to play every epoch
+    :param game_records_path: append every game played (outside the batch simulator) to this game record file
+    """
+    win_length = board_size if win_length is None else win_length
+    if use_exact_evaluator and (board_size, win_length) != (3, 3):
+        raise ValueError('The exact evaluator only solves 3x3 boards')
+
+    best_genes = starting_genes
+    start_cycle = 0
+    total_games = 0
+    previous_elapsed = 0.0
+
+    # Separate streams for the mutations and the games, so the worker count never changes either
+    mutation_seed, games_seed = np.random.SeedSequence(seed).spawn(2)
+    mutation_rng = np.random.default_rng(mutation_seed)
+
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = json.load(open(checkpoint_path, 'r'))
+        best_genes = checkpoint['best_genes']
+        start_cycle = checkpoint['cycle']
+        total_games = checkpoint['total_games']
+        previous_elapsed = checkpoint['elapsed']
+        mutation_rng.bit_generator.state = checkpoint['mutation_rng']
+        games_seed = np.random.SeedSequence(checkpoint['games_seed']['entropy'], spawn_key=checkpoint['games_seed']['spawn_key'], n_children_spawned=checkpoint['games_seed']['n_children_spawned'])
+        # Cycles logged after the checkpoint are played again
+        with open(training_log_path, 'a') as training_log:
+            training_log.truncate(checkpoint['log_size'])
+        if game_records_path and checkpoint.get('records_size') is not None and os.path.exists(game_records_path):
+            with open(game_records_path, 'ab') as records_file:
+                records_file.truncate(checkpoint['records_size'])
+        gene_samples = _Gene_Samples.from_log(training_log_path)
+        print('### RESUMING EVOLUTION AT CYCLE {0} ###'.format(start_cycle))
+    else:
+        open(training_log_path, 'w').close()
+        gene_samples = _Gene_Samples()
+        print('### STARTING EVOLUTION ###')
+
+    pool = multiprocessing.Pool(workers) if workers > 1 and not use_exact_evaluator else None
+    evaluator = Exact_Evaluator() if use_exact_evaluator else None
+    matchup_cache = Matchup_Cache.load(matchup_cache_path, max_cached_matchups) if matchup_cache_path and evaluator is None else None
+    training_log = open(training_log_path, 'a')
+    recorder = game_record.Game_Record_Writer(game_records_path, board_size, win_length) if game_records_path and evaluator is None else None
+
+    resumed_games = total_games
+    start_time = time.time()
 
-        results = {}
-        results[PLAYER1] = 0
-        results[PLAYER2] = 0
-        results[TIE] = 0
+    for i in range(start_cycle, evolution_cycles):
+        cycle_start_time = time.time()
+        evolved_genes = _build_random_gene_mutation(best_genes, evolution_rate, mutation_rng)
 
-        starting_player = PLAYER1
-        for _ in range(epoch_size):
-            results[_play_game(ai1, ai2, starting_player)] += 1
-            starting_player = PLAYER2 if starting_player == PLAYER1 else PLAYER1
+        prior = (0, 0, 0)
+        if evaluator is not None:
+            # Expected tallies of the epoch instead of sampled ones
+            results, is_evolved_better = evaluator.expected_results(best_genes, evolved_genes, epoch_size), None
+        else:
+            cached = matchup_cache.lookup(best_genes, evolved_genes, board_size, win_length, epoch_size) if matchup_cache is not None else None
+            prior = (0, 0, 0) if cached is None else cached
+            results, is_evolved_better = _play_epoch(best_genes, evolved_genes, epoch_size, games_seed.spawn(1)[0], use_batch_simulator, pool, workers, sprt, board_size, win_length, cached, recorder)
+        games = results[PLAYER1] + results[PLAYER2] + results[TIE]
+        # Games of the matchup cached by earlier cycles or runs are not played again, and the exact evaluator plays none
+        played_games = games - sum(prior) if evaluator is None else 0
+        if matchup_cache is not None and played_games > 0:
+            matchup_cache.add(best_genes, evolved_genes, board_size, win_length, epoch_size, results[PLAYER1] - prior[0], results[PLAYER2] - prior[1], results[TIE] - prior[2])
+        total_games += played_games
+        if metrics.ENABLED:
+            metrics.observe('train.cycle', time.time() - cycle_start_time)
+            metrics.count('train.games', played_games)
 
         if show_evolution_output:
             print('Evolution Cycle: {0}'.format(i))
             print('Best Genes: {0}'.format(best_genes))
             print('Current Mutated Genes: {0}'.format(evolved_genes))
-            print('Results: {0}'.format((int(100 * results[PLAYER1] / epoch_size), int(100 * results[PLAYER2] / epoch_size), int(100 * results[TIE] / epoch_size))))
+            print('Results: {0}'.format((int(100 * results[PLAYER1] / games), int(100 * results[PLAYER2] / games), int(100 * results[TIE] / games))))
+            if sprt is not None:
+                print('Games Played: {0} ({1})'.format(games, 'decided' if is_evolved_better is not None else 'undecided'))
+            if sum(prior) > 0:
+                print('Cached Games: {0}'.format(sum(prior)))
             print('--------------------------------------------------')
 
-        if results[PLAYER2] > results[PLAYER1]:
+        # Undecided or non-adaptive epochs keep the majority rule
+        if is_evolved_better is None:
+            is_evolved_better = results[PLAYER2] > results[PLAYER1]
+        if is_evolved_better:
             best_genes = evolved_genes
-        best_genes_log.append(best_genes)
-
-    print('### RUNNING EVOLUTION TOOK {0} SECONDS ###'.format(round(time.time() - start_time, 1)))
-
-    best_genes_dict = {'aggressive_gene': float(best_genes[0]), 'defensive_gene': float(best_genes[1]), 'random_gene': float(best_genes[2])}
-    json.dump(best_genes_dict, open(best_genes_path, 'w'))
-
-    _export_gene_evolution_plot(best_genes_log, gene_plot_path)
-
-
-def run(verbose):
+        gene_samples.append(i, best_genes)
+
+        training_log.write(json.dumps({'cycle': i, 'best_genes': list(best_genes), 'evolved_genes': list(evolved_genes), 'results': [results[PLAYER1], results[PLAYER2], results[TIE]],
+                                       'seconds': time.time() - cycle_start_time}) + '\n')
+        if (i + 1) % checkpoint_interval == 0 and i + 1 < evolution_cycles:
+            checkpoint = _build_checkpoint(i + 1, best_genes, total_games, previous_elapsed + time.time() - start_time, mutation_rng, games_seed, training_log, recorder)
+            _save_training_state(checkpoint, training_log, best_genes_path, gene_samples, gene_plot_path, checkpoint_path, matchup_cache, matchup_cache_path)
+
+    elapsed = time.time() - start_time
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print('### RUNNING EVOLUTION TOOK {0} SECONDS ###'.format(round(previous_elapsed + elapsed, 1)))
+    if evaluator is not None:
+        print('### EVALUATED {0} MATCHUPS EXACTLY ###'.format(evolution_cycles - start_cycle))
+    elif total_games > resumed_games:
+        print('### {0} GAMES/SEC ON {1} WORKER(S) ###'.format(int((total_games - resumed_games) / elapsed), workers))
+    if sprt is not None and evaluator is None:
+        print('### PLAYED {0} OF {1} GAMES ###'.format(total_games, evolution_cycles * epoch_size))
+    if matchup_cache is not None:
+        print('### REUSED {0} OF {1} MATCHUPS FROM THE CACHE ({2} CACHED, {3} EVICTED) ###'.format(matchup_cache.hits, matchup_cache.hits + matchup_cache.misses, len(matchup_cache), matchup_cache.evictions))
+
+    checkpoint = _build_checkpoint(max(evolution_cycles, start_cycle), best_genes, total_games, previous_elapsed + elapsed, mutation_rng, games_seed, training_log, recorder)
+    _save_training_state(checkpoint, training_log, best_genes_path, gene_samples, gene_plot_path, checkpoint_path, matchup_cache, matchup_cache_path)
+    training_log.close()
+    if recorder is not None:
+        print('### RECORDED {0} GAMES ###'.format(recorder.records))
+        recorder.close()
+
+    if mcts_playouts is not None:
+        print('### VALIDATING BEST GENES AGAINST MCTS ({0} PLAYOUTS) ###'.format(mcts_playouts))
+        results = validate_against_mcts(best_genes, mcts_games, mcts_playouts, board_size, win_length, seed)
+        print('Genes Wins: {0}, MCTS Wins: {1}, Ties: {2}'.format(results[PLAYER1], results[PLAYER2], results[TIE]))
+
+
+def run(verbose, batch, workers, seed, benchmark, adaptive, confidence, margin, exact, metrics_path, cycles, resume, checkpoint_interval, board_size, win_length, mcts_playouts=None, use_cache=False, records_path=None):
     """
     Run the program using the cli inputs
     """
-    EVOLUTION_CYCLES = 30
+    EVOLUTION_CYCLES = int(cycles)
     EPOCH_SIZE = 1000
     STARTING_GENES = (40, 40, 20)
     EVOLUTION_RATE = 20
-    BEST_GENES_PATH = os.path.join(os.path.dirname(__file__), '../data/best_genes.json')
-    GENE_PLOT_PATH = os.path.join(os.path.dirname(__file__), '../data/gene_evolution.png')
+    BOARD_SIZE = int(board_size)
+    WIN_LENGTH = BOARD_SIZE if win_length is None else int(win_length)
+    # Other variants keep their own genes, plot, log and checkpoint next to the 3x3 ones
+    SUFFIX = '' if (BOARD_SIZE, WIN_LENGTH) == (3, 3) else '_{0}x{0}_k{1}'.format(BOARD_SIZE, WIN_LENGTH)
+    BEST_GENES_PATH = os.path.join(os.path.dirname(__file__), '../data/best_genes{0}.json'.format(SUFFIX))
+    GENE_PLOT_PATH = os.path.join(os.path.dirname(__file__), '../data/gene_evolution{0}.png'.format(SUFFIX))
+    LOG_PATH = TRAINING_LOG_PATH.replace('.jsonl', SUFFIX + '.jsonl')
+    STATE_PATH = CHECKPOINT_PATH.replace('.json', SUFFIX + '.json')
     SHOW_EVOLUTION_OUTPUT = bool(verbose)
-
-    main(EVOLUTION_CYCLES, EPOCH_SIZE, STARTING_GENES, EVOLUTION_RATE, BEST_GENES_PATH, GENE_PLOT_PATH, SHOW_EVOLUTION_OUTPUT)
+    USE_BATCH_SIMULATOR = bool(batch)
+    WORKERS = max(int(workers), 1)
+    SEED = None if seed is None else int(seed)
+    SPRT = (float(margin), float(confidence)) if adaptive else None
+    USE_EXACT_EVALUATOR = bool(exact)
+    SHOULD_RESUME = bool(resume)
+    CHECKPOINT_INTERVAL = max(int(checkpoint_interval), 1)
+    MCTS_PLAYOUTS = None if mcts_playouts is None else int(mcts_playouts)
+    MCTS_GAMES = 100
+    # Opt-in, cached results making seeded runs depend on the cache; matchups of every variant and epoch size share it, keyed by both
+    MATCHUP_CACHE = MATCHUP_CACHE_PATH if use_cache else None
+    MAX_CACHED_MATCHUPS = 100000
+    GAME_RECORDS_PATH = records_path if records_path else None
+
+    if metrics_path:
+        metrics.enable(metrics_path)
+
+    if benchmark:
+        benchmark_workers(WORKERS, EPOCH_SIZE, EVOLUTION_CYCLES, USE_BATCH_SIMULATOR, SEED)
+        return
+
+    main(EVOLUTION_CYCLES, EPOCH_SIZE, STARTING_GENES, EVOLUTION_RATE, BEST_GENES_PATH, GENE_PLOT_PATH, SHOW_EVOLUTION_OUTPUT, USE_BATCH_SIMULATOR, WORKERS, SEED, SPRT, USE_EXACT_EVALUATOR,
+         LOG_PATH, STATE_PATH, CHECKPOINT_INTERVAL, SHOULD_RESUME, BOARD_SIZE, WIN_LENGTH, MCTS_PLAYOUTS, MCTS_GAMES,
+         MATCHUP_CACHE, MAX_CACHED_MATCHUPS, GAME_RECORDS_PATH)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Tic Toe Game Evolution AI Trainer')
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Output the evolution cycle results')
+    parser.add_argument('-b', '--batch', dest='batch', action='store_true', help='Simulate each epoch as one vectorized NumPy batch of games')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=1, help='Split each epoch across this many worker processes')
+    parser.add_argument('-s', '--seed', dest='seed', type=int, default=None, help='Seed the evolution so runs are reproducible for any worker count')
+    parser.add_argument('--benchmark-workers', dest='benchmark', action='store_true', help='Report games/sec and scaling efficiency from 1 up to --workers workers instead of training')
+    parser.add_argument('-a', '--adaptive', dest='adaptive', action='store_true', help='Stop each epoch as soon as a sequential probability ratio test decides the matchup')
+    parser.add_argument('--confidence', dest='confidence', type=float, default=0.95, help='Confidence level of the adaptive test')
+    parser.add_argument('--margin', dest='margin', type=float, default=0.05, help='Decisive-game win rate margin around 50%% the adaptive test tells apart')
+    parser.add_argument('-x', '--exact', dest='exact', action='store_true', help='Compare genes by their exact expected results instead of simulating games')
+    parser.add_argument('--metrics', dest='metrics', default=None, help='Record cycle timings and in-process engine call latencies, dumped as json to this path at exit')
+    parser.add_argument('-c', '--cycles', dest='cycles', type=int, default=30, help='Evolution cycles to run, counting those of a resumed run')
+    parser.add_argument('-r', '--resume', dest='resume', action='store_true', help='Resume from the last checkpoint of data/training_checkpoint.json, replaying the cycles logged after it')
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=int, default=100, help='Cycles between checkpoints of the trainer state, best genes and plot')
+    parser.add_argument('-n', '--board-size', dest='board_size', type=int, default=3, help='Train for an NxN board (genes saved as data/best_genes_NxN_kK.json unless 3x3)')
+    parser.add_argument('-k', '--win-length', dest='win_length', type=int, default=None, help='Pieces in a row needed to win (default: the board size)')
+    parser.add_argument('--mcts-playouts', dest='mcts_playouts', type=int, default=None, help='After training, play the best genes against a monte carlo tree search of this many playouts per move')
+    parser.add_argument('--cache', dest='use_cache', action='store_true', help='Reuse and keep the matchup tallies of data/matchup_cache.json instead of playing every epoch (seeded runs then depend on the cache)')
+    parser.add_argument('--record', dest='record', default=None, help='Append every game played to this compact game record file (not with -b or -x, nor for cached matchups)')
     args = parser.parse_args()
 
     try:
-        run(args.verbose)
+        run(args.verbose, args.batch, args.workers, args.seed, args.benchmark, args.adaptive, args.confidence, args.margin, args.exact, args.metrics, args.cycles, args.resume, args.checkpoint_interval, args.board_size, args.win_length, args.mcts_playouts, args.use_cache, args.record)
     except Exception as e:
         print(e)
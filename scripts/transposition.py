@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+from board import canonical_position, map_cell, unmap_cell
+
+
+class Transposition_Table():
+
+    def __init__(self, board_size=3, max_entries=100000):
+        """
+        Initialize a bounded, least-recently-used table of searched positions keyed on their symmetry-reduced form
+        """
+        self._BOARD_SIZE = int(board_size)
+        self._MAX_ENTRIES = int(max_entries)
+
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, mover_mask, other_mask):
+        """
+        Find a stored position for the side to move
+        :return: (score, best cell in the caller's orientation, stored entry extras) or None
+        """
+        key, symmetry = canonical_position(mover_mask, other_mask, self._BOARD_SIZE)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        best_cell = entry[1] if entry[1] < 0 else unmap_cell(entry[1], symmetry, self._BOARD_SIZE)
+        return (entry[0], best_cell) + entry[2:]
+
+    def store(self, mover_mask, other_mask, score, best_cell, *extras):
+        """
+        Store the score and best cell of a position for the side to move
+        """
+        key, symmetry = canonical_position(mover_mask, other_mask, self._BOARD_SIZE)
+        canonical_cell = best_cell if best_cell < 0 else map_cell(best_cell, symmetry, self._BOARD_SIZE)
+        self._entries[key] = (score, canonical_cell) + extras
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._MAX_ENTRIES:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every stored position
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0